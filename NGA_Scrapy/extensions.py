@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+自定义扩展：队列化日志写入
+
+Scrapy默认的根日志处理器在发出日志的线程中直接加锁、格式化并写文件，
+高并发且LOG_LEVEL=DEBUG时，处理器锁会成为串行化点。
+本扩展将其替换为 QueueHandler + QueueListener：
+- 发日志的线程只负责入队
+- 单独的监听线程使用 RotatingFileHandler 按 LOG_FILE_MAX_BYTES/LOG_FILE_BACKUP_COUNT 轮转写入
+"""
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.log import get_scrapy_root_handler
+
+logger = logging.getLogger(__name__)
+
+
+class QueueLogging:
+    """将Scrapy根日志处理器替换为队列化的轮转文件处理器"""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.listener = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('LOG_QUEUE_ENABLED', True):
+            raise NotConfigured('Queue logging not enabled')
+        if not crawler.settings.get('LOG_FILE'):
+            raise NotConfigured('Queue logging requires LOG_FILE')
+
+        ext = cls(crawler.settings)
+        # Scrapy在创建扩展之后还会按最终配置重装一次根处理器，因此在spider_opened时再替换
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        return ext
+
+    def spider_opened(self, spider):
+        root_handler = get_scrapy_root_handler()
+        # 只接管Scrapy安装的文件处理器；未安装根处理器时保持默认行为
+        if self.listener or not isinstance(root_handler, logging.FileHandler):
+            return
+
+        settings = self.settings
+        file_handler = RotatingFileHandler(
+            root_handler.baseFilename,
+            mode='a',  # Scrapy的处理器已按LOG_FILE_APPEND打开过文件
+            maxBytes=settings.getint('LOG_FILE_MAX_BYTES', 10 * 1024 * 1024),
+            backupCount=settings.getint('LOG_FILE_BACKUP_COUNT', 5),
+            encoding=root_handler.encoding,
+        )
+        file_handler.setFormatter(root_handler.formatter)
+
+        # 级别和过滤器（如LOG_SHORT_NAMES）放在入队之前生效，不需要的记录不进入队列
+        queue_handler = QueueHandler(queue.SimpleQueue())
+        queue_handler.setLevel(root_handler.level)
+        for log_filter in root_handler.filters:
+            queue_handler.addFilter(log_filter)
+
+        self.listener = QueueListener(queue_handler.queue, file_handler)
+        self.listener.start()
+        # 进程退出时停止监听线程，确保队列中剩余的日志写入文件
+        atexit.register(self.listener.stop)
+
+        logging.root.removeHandler(root_handler)
+        root_handler.close()
+        logging.root.addHandler(queue_handler)
+
+        logger.info(f"Queue logging enabled: {root_handler.baseFilename}")
@@ -1,19 +1,30 @@
 import scrapy
 import json
 import os
+import re
 import time
 import threading
 import uuid
 import logging
 import sys
-from queue import Queue, Empty
+import traceback
+from array import array
+from queue import Queue
 from typing import Optional, Dict, List, Callable, Any
 from playwright.sync_api import TimeoutError as PlaywrightTimeoutError, sync_playwright
 from scrapy.exceptions import NotConfigured
 from scrapy import signals
+from scrapy.utils.defer import maybe_deferred_to_future
+from twisted.internet import threads
 from NGA_Scrapy.utils.proxy_manager import get_proxy_manager
 from NGA_Scrapy.utils.ban_detector import BanDetector
 from NGA_Scrapy.utils.instance_manager import BrowserInstanceManager
+from NGA_Scrapy.utils.debug_html import url_digest
+
+try:
+    import orjson  # 可选依赖：C实现的JSON编解码，未安装时回退到标准库json
+except ImportError:
+    orjson = None
 
 
 # ========== 配置常量 ==========
@@ -47,6 +58,13 @@ DEFAULT_VIEWPORT = {'width': 1920, 'height': 1080}
 REQUEST_TIMEOUT = 60
 NAV_TIMEOUT = 15000
 LOAD_TIMEOUT = 5000
+ANTI_BOT_KEYWORDS = ('访问过于频繁', 'IP被封', '验证码', 'captcha', '人机验证')
+# 预编译为单个正则，一次扫描即可匹配全部关键词
+ANTI_BOT_PATTERN = re.compile('|'.join(map(re.escape, ANTI_BOT_KEYWORDS)))
+# 图片请求不走浏览器，按扩展名匹配（忽略大小写，允许带查询串/锚点）
+IMAGE_URL_PATTERN = re.compile(r'\.(?:jpe?g|png|gif|webp)(?:[?#]|$)', re.I)
+MAX_USES_PER_CONTEXT = 50  # 上下文使用N次后自动回收重建，避免长时间运行内存持续增长
+FAILED_BROWSER_COOLDOWN = 300  # 实例失败后的冷却时间（秒），期间不参与轮询
 
 
 # ========== 工具类 ==========
@@ -124,8 +142,9 @@ class CookieManager:
             return None
 
         try:
-            with open(cookies_file, 'r', encoding='utf-8') as f:
-                cookies = json.load(f)
+            with open(cookies_file, 'rb') as f:
+                raw = f.read()
+            cookies = orjson.loads(raw) if orjson else json.loads(raw.decode('utf-8'))
 
             processed = []
             for c in cookies:
@@ -158,7 +177,7 @@ class CookieManager:
 
             self.cookies = processed
             return processed
-        except json.JSONDecodeError as e:
+        except json.JSONDecodeError as e:  # orjson.JSONDecodeError 是其子类
             self.logger.error(f"Invalid JSON in cookies file: {e}")
             return None
         except Exception as e:
@@ -187,8 +206,12 @@ class CookieManager:
                 )
 
                 if needs_update:
-                    with open('cookies.txt', 'w', encoding='utf-8') as f:
-                        json.dump(current_cookies, f, ensure_ascii=False, indent=2)
+                    if orjson:
+                        with open('cookies.txt', 'wb') as f:
+                            f.write(orjson.dumps(current_cookies, option=orjson.OPT_INDENT_2))
+                    else:
+                        with open('cookies.txt', 'w', encoding='utf-8') as f:
+                            json.dump(current_cookies, f, ensure_ascii=False, indent=2)
 
                     self.cookies = current_cookies
                     expires_time = time.strftime(
@@ -206,44 +229,49 @@ class CookieManager:
 # ========== 页面获取器 ==========
 class PageFetcher:
     """页面获取器 - 优化版：单实例多页面复用"""
-    def __init__(self, logger):
+    def __init__(self, logger, max_browsers: int = 2):
         self.logger = logger
-        self._active_pages = {}  # 缓存活跃页面，格式: {browser_index: page}
-        self._page_lock = threading.Lock()  # 页面访问锁
+        # 按槽位缓存活跃页面，下标即 browser_index % max_browsers
+        # 所有 fetch 都在 Playwright 工作线程中串行执行，每个槽位同一时刻只有一个使用者，无需加锁
+        self._active_pages: List[Optional[Any]] = [None] * max(1, max_browsers)
+        # 按槽位记录已检查过cookie的上下文；同一上下文只查询一次context.cookies()，
+        # 不在每次导航前都与浏览器进程往返一次（上下文被回收重建后对象改变，会重新检查）
+        self._cookie_contexts: List[Optional[Any]] = [None] * max(1, max_browsers)
         self.debug_dir = 'debug_html'  # HTML调试文件保存目录
 
     def fetch(self, browser_pool: List, url: str, cookies: Optional[List],
               browser_index: int, referer: str = 'https://bbs.nga.cn/') -> Dict:
         """获取页面内容 - 复用页面提高效率"""
         browser, context = browser_pool[browser_index % len(browser_pool)]
+        slot = browser_index % len(self._active_pages)
 
         # 尝试获取或创建页面
-        page = None
-        with self._page_lock:
-            if browser_index in self._active_pages:
-                page = self._active_pages[browser_index]
-                self.logger.debug(f"Reusing page for browser {browser_index}")
-            else:
-                page = context.new_page()
-                self._active_pages[browser_index] = page
-                self.logger.debug(f"Created new page for browser {browser_index}")
+        page = self._active_pages[slot]
+        if page is None:
+            page = context.new_page()
+            self._active_pages[slot] = page
+            self.logger.debug("Created new page for browser %s", browser_index)
+        else:
+            self.logger.debug("Reusing page for browser %s", browser_index)
 
         try:
-            self.logger.debug(f"Loading page: {url} (browser {browser_index})")
+            self.logger.debug("Loading page: %s (browser %s)", url, browser_index)
 
             # 只在首次访问时设置cookie，后续保持会话
-            if cookies and len(context.cookies()) == 0:
-                self.logger.debug(f"Setting {len(cookies)} cookies")
-                context.add_cookies(cookies)
-                time.sleep(0.1)
+            if cookies and self._cookie_contexts[slot] is not context:
+                if len(context.cookies()) == 0:
+                    self.logger.debug("Setting %d cookies", len(cookies))
+                    context.add_cookies(cookies)
+                    time.sleep(0.1)
+                self._cookie_contexts[slot] = context
 
             page.set_extra_http_headers({'Referer': referer})
 
-            self.logger.debug(f"Navigating to: {url}")
+            self.logger.debug("Navigating to: %s", url)
             nav_start = time.time()
             page.goto(url, wait_until="domcontentloaded", timeout=NAV_TIMEOUT)
             nav_time = time.time() - nav_start
-            self.logger.debug(f"Navigation complete: {nav_time:.2f}s")
+            self.logger.debug("Navigation complete: %.2fs", nav_time)
 
             page.wait_for_load_state("domcontentloaded", timeout=LOAD_TIMEOUT)
 
@@ -252,7 +280,7 @@ class PageFetcher:
 
             # 🔍 [DEBUG] 检查页面内容是否异常
             content_length = len(page_content)
-            self.logger.debug(f"🔍 [DEBUG] 页面内容长度: {content_length} 字符")
+            self.logger.debug("[DEBUG] 页面内容长度: %d 字符", content_length)
 
             # 如果页面内容过短或异常，保存HTML用于调试
             if content_length < 1000:
@@ -265,13 +293,14 @@ class PageFetcher:
                 self.save_html_debug_file(page_content, url, "no_nga_content")
 
             # 检查是否有反爬虫提示
-            if any(keyword in page_content for keyword in ['访问过于频繁', 'IP被封', '验证码', 'captcha', '人机验证']):
+            if ANTI_BOT_PATTERN.search(page_content):
                 self.logger.warning(f"⚠️ [DEBUG] 检测到反爬虫或验证页面")
                 self.save_html_debug_file(page_content, url, "anti_bot")
 
+            # 在工作线程内一次性编码为bytes，供HtmlResponse直接使用，避免调用方再复制一份
             return {
                 'url': page.url,
-                'content': page_content,
+                'content': page_content.encode('utf-8', 'replace'),
                 'success': True,
                 'nav_time': nav_time,
                 'content_length': content_length
@@ -279,28 +308,40 @@ class PageFetcher:
         except Exception as e:
             self.logger.error(f"Page load failed: {url}, error: {type(e).__name__}: {str(e)}")
             # 如果页面出错，关闭并移除缓存
-            with self._page_lock:
-                if browser_index in self._active_pages:
-                    try:
-                        self._active_pages[browser_index].close()
-                    except:
-                        pass
-                    del self._active_pages[browser_index]
-            raise
-
-    def close_all_pages(self):
-        """关闭所有缓存的页面"""
-        with self._page_lock:
-            for page in self._active_pages.values():
+            if self._active_pages[slot] is not None:
                 try:
-                    page.close()
+                    self._active_pages[slot].close()
                 except:
                     pass
-            self._active_pages.clear()
-            self.logger.debug("All cached pages closed")
+                self._active_pages[slot] = None
+            raise
 
-    def save_html_debug_file(self, content: str, url: str, reason: str = ""):
-        """保存HTML页面到调试文件"""
+    def drop_page(self, browser_index: int):
+        """关闭并移除指定槽位的缓存页面（需在工作线程中调用）"""
+        slot = browser_index % len(self._active_pages)
+        page = self._active_pages[slot]
+        if page is None:
+            return
+        try:
+            page.close()
+        except:
+            pass
+        self._active_pages[slot] = None
+
+    def close_all_pages(self):
+        """关闭所有缓存的页面"""
+        for slot, page in enumerate(self._active_pages):
+            if page is None:
+                continue
+            try:
+                page.close()
+            except:
+                pass
+            self._active_pages[slot] = None
+        self.logger.debug("All cached pages closed")
+
+    def save_html_debug_file(self, content, url: str, reason: str = ""):
+        """保存HTML页面到调试文件（content可为str或utf-8编码的bytes）"""
         import os
         import time
 
@@ -310,8 +351,7 @@ class PageFetcher:
 
         # 生成文件名
         timestamp = time.strftime("%Y%m%d_%H%M%S", time.localtime())
-        # 从URL中提取有用的部分作为文件名
-        url_hash = hash(url) % 10000
+        url_hash = url_digest(url)
         filename = f"{timestamp}_{url_hash}_{reason}.html"
         filepath = os.path.join(self.debug_dir, filename)
 
@@ -328,6 +368,8 @@ class PageFetcher:
 
 """
                 f.write(debug_header)
+                if isinstance(content, bytes):
+                    content = content.decode('utf-8', 'replace')
                 f.write(content)
 
             self.logger.debug(f"💾 [DEBUG] HTML已保存: {filepath}")
@@ -380,17 +422,23 @@ class ErrorSuppressor:
 # ========== Playwright工作线程 ==========
 class PlaywrightWorker:
     """Playwright专用工作线程（负责浏览器池管理）"""
+    _SHUTDOWN_SENTINEL = (None, None, None, None, None)
+
     def __init__(self, max_browsers: int, proxy_manager=None, logger=None):
         self.max_browsers = max_browsers
         self.proxy_manager = proxy_manager
         self.logger = logger or self._default_logger
         self._workers = []
         self._task_queue = Queue()
+        # 任务结果表：工作线程先写入结果再 set() 对应 Event，调用方在 Event 触发后读取，
+        # 每个 request_id 只有一个读写方，无需额外的 Condition 广播；
+        # 超时放弃（pop）与写入结果（检查后写入）之间用 _result_lock 互斥，避免超时任务的结果写回表中泄漏
         self._result_map = {}
-        self._condition = threading.Condition(threading.Lock())
+        self._result_lock = threading.Lock()
         self._stop_event = threading.Event()
         self._initialized = threading.Event()
         self._browser_pool = []
+        self._context_kwargs = []  # 每个槽位创建上下文时使用的参数，回收重建时复用
         self._playwright = None
         self._start_worker()
 
@@ -447,9 +495,25 @@ class PlaywrightWorker:
 
             context = browser.new_context(**context_kwargs)
             self._browser_pool.append((browser, context))
+            self._context_kwargs.append(context_kwargs)
 
         return playwright
 
+    def recycle_context(self, browser_pool: List, browser_index: int, cookies: Optional[List] = None):
+        """关闭指定槽位的上下文并用相同参数重建（需在工作线程中调用）"""
+        slot = browser_index % len(browser_pool)
+        browser, context = browser_pool[slot]
+
+        try:
+            context.close()
+        except Exception as e:
+            self.logger.warning(f"Close context {slot} failed during recycle: {e}")
+
+        new_context = browser.new_context(**self._context_kwargs[slot])
+        if cookies:
+            new_context.add_cookies(cookies)
+        browser_pool[slot] = (browser, new_context)
+
     def _playwright_worker_loop(self):
         """Playwright工作线程主循环"""
         try:
@@ -462,50 +526,49 @@ class PlaywrightWorker:
 
             # 工作线程主循环
             last_queue_check = time.time()
+            debug_enabled = self.logger.isEnabledFor(logging.DEBUG)
             while not self._stop_event.is_set():
                 try:
+                    # 阻塞等待任务，shutdown 时通过哨兵任务唤醒，避免轮询
                     request_id, task_func, args, kwargs, result_event = \
-                        self._task_queue.get(timeout=0.1)
+                        self._task_queue.get()
+
+                    if task_func is None:
+                        break
 
                     if self._stop_event.is_set():
                         if result_event:
                             result_event.set()
                         break
 
-                    # 【诊断日志】记录任务队列状态
-                    current_time = time.time()
-                    if current_time - last_queue_check > 10:  # 每10秒记录一次
-                        queue_size = self._task_queue.qsize()
-                        self.logger.debug(f"📊 [工作线程诊断] 任务队列大小: {queue_size}")
-                        last_queue_check = current_time
+                    # 【诊断日志】记录任务队列状态（仅DEBUG级别下采样）
+                    if debug_enabled:
+                        current_time = time.time()
+                        if current_time - last_queue_check > 10:  # 每10秒记录一次
+                            queue_size = self._task_queue.qsize()
+                            self.logger.debug("[工作线程诊断] 任务队列大小: %d", queue_size)
+                            last_queue_check = current_time
 
                     task_start = time.time()
                     try:
                         # 在工作线程中执行任务
                         task_name = getattr(task_func, '__name__', 'unknown_task')
-                        self.logger.debug(f"🔄 [工作线程] 开始执行任务: {task_name}")
+                        self.logger.debug("[工作线程] 开始执行任务: %s", task_name)
                         
                         result = task_func(self._browser_pool, *args, **kwargs)
                         
                         task_duration = time.time() - task_start
-                        self.logger.debug(f"✅ [工作线程] 任务完成: {task_name}, 耗时: {task_duration:.2f}s")
+                        self.logger.debug("[工作线程] 任务完成: %s, 耗时: %.2fs", task_name, task_duration)
                         
-                        with self._condition:
-                            self._result_map[request_id] = ('success', result, None)
+                        self._store_result(request_id, ('success', result, None))
                     except Exception as e:
                         task_duration = time.time() - task_start
                         self.logger.error(f"❌ [工作线程] 任务失败: {task_name}, 耗时: {task_duration:.2f}s, 错误: {e}")
-                        import traceback
-                        with self._condition:
-                            self._result_map[request_id] = ('error', None, (type(e), e, traceback.format_exc()))
-                    finally:
-                        with self._condition:
-                            self._condition.notify_all()
+                        # 只保存异常对象本身，堆栈格式化推迟到调用方确实需要时
+                        self._store_result(request_id, ('error', None, (type(e), e, None)))
 
                     if result_event:
                         result_event.set()
-                except Empty:
-                    continue
                 except Exception as e:
                     self.logger.error(f"Worker error: {e}")
 
@@ -584,7 +647,6 @@ class PlaywrightWorker:
                     if 'greenlet' in error_type.lower():
                         self.logger.warning(f"🟡 [解决方案] 检测到greenlet错误，这通常是Playwright关闭时的正常现象")
                         self.logger.debug(f"🟡 [解决方案] greenlet错误不会影响功能，继续关闭其他实例...")
-                        import traceback
                         self.logger.debug(f"🟡 [解决方案] greenlet错误详情:\n{traceback.format_exc()}")
                     else:
                         self.logger.error(f"❌ [解决方案] 非greenlet错误关闭浏览器: {e}")
@@ -620,6 +682,12 @@ class PlaywrightWorker:
             self._initialized.set()  # 确保通知等待者
             raise
 
+    def _store_result(self, request_id, outcome):
+        """写入任务结果；调用方已超时放弃的任务不再写入，避免结果表泄漏"""
+        with self._result_lock:
+            if request_id in self._result_map:
+                self._result_map[request_id] = outcome
+
     def execute(self, task_func: Callable, *args, **kwargs):
         """在工作线程中执行任务"""
         if self._stop_event.is_set():
@@ -629,31 +697,32 @@ class PlaywrightWorker:
         result_event = threading.Event()
         task_name = getattr(task_func, '__name__', str(task_func))
 
-        with self._condition:
-            self._result_map[request_id] = None
+        self._result_map[request_id] = None
 
         self._task_queue.put((request_id, task_func, args, kwargs, result_event))
-        self.logger.debug(f"Task queued: {task_name}")
+        self.logger.debug("Task queued: %s", task_name)
 
         # 等待结果
         if not result_event.wait(timeout=REQUEST_TIMEOUT):
-            with self._condition:
+            with self._result_lock:
                 self._result_map.pop(request_id, None)
             raise TimeoutError(f"Task timeout: {task_name}")
 
-        with self._condition:
-            status, result, error = self._result_map.pop(request_id, ('timeout', None, 'Timeout'))
-
-            if status == 'success':
-                self.logger.debug(f"Task completed: {task_name}")
-                return result
-            elif status == 'error':
-                exc_type, exc_value, _ = error
-                self.logger.error(f"Task failed: {task_name}, {exc_type.__name__}: {exc_value}")
-                raise exc_type(exc_value)
-            else:
-                self.logger.error(f"Task timeout: {task_name}")
-                raise TimeoutError(f"Task timeout: {task_name}")
+        status, result, error = self._result_map.pop(request_id, ('timeout', None, 'Timeout'))
+
+        if status == 'success':
+            self.logger.debug("Task completed: %s", task_name)
+            return result
+        elif status == 'error':
+            exc_type, exc_value, _ = error
+            self.logger.error(f"Task failed: {task_name}, {exc_type.__name__}: {exc_value}")
+            if self.logger.isEnabledFor(logging.DEBUG):
+                tb_text = ''.join(traceback.format_exception(exc_type, exc_value, exc_value.__traceback__))
+                self.logger.debug(f"Task traceback: {task_name}\n{tb_text}")
+            raise exc_value
+        else:
+            self.logger.error(f"Task timeout: {task_name}")
+            raise TimeoutError(f"Task timeout: {task_name}")
 
     def shutdown(self, timeout: int = 10):
         """关闭工作线程"""
@@ -661,12 +730,11 @@ class PlaywrightWorker:
         self.logger.debug(f"🛑 [诊断] 当前线程ID: {threading.get_ident()}")
         self.logger.debug(f"🛑 [诊断] 工作线程数量: {len(self._workers)}")
 
-        # 【解决方案】先设置停止标志，然后等待工作线程自然结束
+        # 【解决方案】先设置停止标志，再投递哨兵任务唤醒阻塞中的工作线程
+        # 工作线程会先完成当前任务，取到哨兵后立即退出，由下面的 join 等待
         self._stop_event.set()
-
-        # 【解决方案】给工作线程更多时间完成当前任务，避免强制中断
-        self.logger.debug("🛑 [解决方案] 等待工作线程完成当前任务...")
-        time.sleep(2)  # 给工作线程2秒时间完成当前任务
+        for _ in self._workers:
+            self._task_queue.put(self._SHUTDOWN_SENTINEL)
 
         # 【诊断日志】记录每个工作线程的状态
         for i, worker in enumerate(self._workers):
@@ -694,8 +762,10 @@ class BrowserPool:
         self.proxy_manager = proxy_manager
         self.logger = logger or self._default_logger
         self.stats = PerformanceStats()
-        self._page_fetcher = PageFetcher(self.logger)
+        self._page_fetcher = PageFetcher(self.logger, max_browsers)
         self._playwright_worker = PlaywrightWorker(max_browsers, proxy_manager, logger)
+        self._use_count: Dict[int, int] = {}  # 每个槽位当前上下文的使用次数
+        self._use_lock = threading.Lock()  # fetch_page在多个线程池线程中并发调用，计数和回收判断需互斥
 
     def _default_logger(self):
         import logging
@@ -707,7 +777,31 @@ class BrowserPool:
         def _fetch_task(browser_pool):
             return self._page_fetcher.fetch(browser_pool, url, cookies, browser_index)
 
-        return self._playwright_worker.execute(_fetch_task)
+        result = self._playwright_worker.execute(_fetch_task)
+        self._count_context_use(browser_index, cookies)
+        return result
+
+    def _count_context_use(self, browser_index: int, cookies: Optional[List]):
+        """累计上下文使用次数，达到阈值后回收重建"""
+        slot = browser_index % self.max_browsers
+        # 只在锁内计数和清零，同一槽位达到阈值时只有一个线程执行回收；回收任务在锁外等待
+        with self._use_lock:
+            uses = self._use_count.get(slot, 0) + 1
+            if uses < MAX_USES_PER_CONTEXT:
+                self._use_count[slot] = uses
+                return
+            self._use_count[slot] = 0
+
+        def _recycle_task(browser_pool):
+            self._page_fetcher.drop_page(slot)
+            self._playwright_worker.recycle_context(browser_pool, slot, cookies)
+
+        try:
+            self._playwright_worker.execute(_recycle_task)
+            self.stats.log_recycle()
+            self.logger.info(f"Recycled browser context {slot} after {uses} uses")
+        except Exception as e:
+            self.logger.warning(f"Recycle browser context {slot} failed: {e}")
 
     def log_pool_status(self):
         """记录连接池状态"""
@@ -743,8 +837,13 @@ class PlaywrightMiddleware:
         self.instance_manager = None
         self.last_stat_time = time.time()
         self._browser_index = 0
-        self._failed_browsers = {}
+        # 按槽位（browser_index % 池大小）记录最近一次失败时间，读取无需加锁，写入在_lock下进行
+        self._failed_at = array('d', [0.0])
+        # 可用实例位图：第i位为1表示槽位i不在失败冷却期；冷却期已过的槽位在选择实例时恢复
+        self._available_mask = 1
         self._lock = threading.Lock()
+        self.debug_url_log = False  # 是否记录每个read.php请求及调度队列长度（DEBUG_URL_LOG）
+        self._probe_ctr = 0  # 调度队列诊断的采样计数器
 
     @classmethod
     def from_crawler(cls, crawler):
@@ -763,6 +862,13 @@ class PlaywrightMiddleware:
         self.logger.info("Playwright middleware starting")
         self.logger.info("=" * 60)
 
+        self.debug_url_log = spider.settings.getbool('DEBUG_URL_LOG', False)
+
+        # 池大小在此确定，一次性分配失败时间数组和可用位图
+        pool_size = spider.settings.getint('PLAYWRIGHT_POOL_SIZE', 2)
+        self._failed_at = array('d', [0.0] * pool_size)
+        self._available_mask = (1 << pool_size) - 1
+
         # 初始化Cookie管理器
         self.cookie_manager = CookieManager(self.logger)
         self.cookie_manager.load()
@@ -834,9 +940,10 @@ class PlaywrightMiddleware:
         if self.instance_manager:
             self.logger.info("🛑 [解决方案] 第1步: 停止实例管理器...")
             self.instance_manager.stop()
+            # 等待工作线程确实结束后再关闭浏览器池（最多5秒），不再固定休眠
+            if not self.instance_manager.stopped.wait(5):
+                self.logger.warning("⚠️ [解决方案] 实例管理器线程未在5秒内全部结束")
             self.logger.info("✅ [解决方案] 实例管理器停止完成")
-            # 等待一秒确保所有线程完全停止
-            time.sleep(1)
 
         # 2. 然后关闭浏览器池，此时没有其他线程在操作浏览器
         if self.browser_pool:
@@ -846,17 +953,23 @@ class PlaywrightMiddleware:
             
         self.logger.info("✅ [解决方案] Spider关闭处理完成")
 
-    def process_request(self, request, spider):
+    async def process_request(self, request, spider):
         """处理请求"""
-        self.logger = spider.logger
+        # 跳过图片请求（放在最前面，避免后续的日志和统计开销）
+        if IMAGE_URL_PATTERN.search(request.url):
+            return None
 
         # 【新增调试】记录每个被调用的请求
-        if 'read.php' in request.url:
+        if self.debug_url_log and 'read.php' in request.url:
             self.logger.debug(f"🔍 [Middleware] 收到请求: {request.url}, Priority: {request.priority}")
-            # 【诊断日志】检查调度队列状态
-            if hasattr(spider.crawler.engine, 'scheduler') and hasattr(spider.crawler.engine.scheduler, 'queue'):
-                queue_size = len(spider.crawler.engine.scheduler.queue)
-                self.logger.info(f"📊 [队列诊断] 当前调度队列长度: {queue_size}")
+            # 【诊断日志】检查调度队列状态（每256个请求采样一次）
+            self._probe_ctr += 1
+            if self._probe_ctr & 0xff == 0:
+                try:
+                    queue_size = len(spider.crawler.engine.scheduler)
+                    self.logger.info(f"📊 [队列诊断] 当前调度队列长度: {queue_size}")
+                except (AttributeError, TypeError):
+                    pass
 
         # 统计报告
         if time.time() - self.last_stat_time > 300:
@@ -866,10 +979,6 @@ class PlaywrightMiddleware:
                 self.logger.info(self.instance_manager.get_status_report())
             self.last_stat_time = time.time()
 
-        # 跳过图片请求
-        if 'jpg' in request.url:
-            return None
-
         try:
             # 确保浏览器池已初始化
             if not self.browser_pool:
@@ -878,7 +987,17 @@ class PlaywrightMiddleware:
                     proxy_manager=self.proxy_manager,
                     logger=self.logger
                 )
+        except Exception as e:
+            self.logger.error(f"Request processing failed: {e}")
+            return None
 
+        # 页面获取需要等待Playwright工作线程返回结果，放到reactor线程池中执行，
+        # 等待期间Scrapy继续调度其他请求，而不是阻塞reactor
+        return await maybe_deferred_to_future(threads.deferToThread(self._fetch_response, request))
+
+    def _fetch_response(self, request):
+        """在reactor线程池中获取页面并构造响应（可阻塞）"""
+        try:
             # 获取可用浏览器实例
             browser_index = self._select_browser_instance()
             if browser_index is None:
@@ -889,7 +1008,9 @@ class PlaywrightMiddleware:
             for attempt in range(3):
                 try:
                     # 【诊断日志】记录页面获取开始
-                    self.logger.info(f"🚀 [页面获取] 开始获取页面: {request.url[:80]}... (浏览器实例: {browser_index}, 尝试: {attempt + 1}/3)")
+                    if self.logger.isEnabledFor(logging.DEBUG):
+                        self.logger.debug("🚀 [页面获取] 开始获取页面: %s... (浏览器实例: %d, 尝试: %d/3)",
+                                          request.url[:80], browser_index, attempt + 1)
                     
                     start_time = time.time()
                     result = self.browser_pool.fetch_page(
@@ -902,20 +1023,21 @@ class PlaywrightMiddleware:
                     if self.instance_manager:
                         self.instance_manager.report_success(browser_index, response_time)
 
-                    self.logger.info(f"✅ [页面获取成功] {request.url[:80]}... ({response_time:.2f}s)")
-                    self.logger.info(f"  🔍 [DEBUG] 内容长度: {result.get('content_length', 0)} 字符")
+                    if self.logger.isEnabledFor(logging.INFO):
+                        self.logger.info("✅ [页面获取成功] %s... (%.2fs, 内容长度: %d 字符)",
+                                         request.url[:80], response_time, result.get('content_length', 0))
 
                     # 创建响应对象
                     response = scrapy.http.HtmlResponse(
                         url=result['url'],
-                        body=result['content'].encode('utf-8'),
+                        body=result['content'],
                         encoding='utf-8',
                         request=request,
                         status=200  # 明确设置状态码
                     )
 
                     # 🔍 [DEBUG] 在返回响应前检查内容
-                    if result.get('content_length', 0) < 1000:
+                    if len(result['content']) < 1000:
                         self.logger.warning(f"⚠️ [DEBUG] 响应内容过短，保存HTML用于调试")
                         if hasattr(self, '_page_fetcher'):
                             self._page_fetcher.save_html_debug_file(
@@ -934,8 +1056,7 @@ class PlaywrightMiddleware:
                     if self.instance_manager:
                         is_banned = self.instance_manager.report_failure(browser_index, e)
 
-                    with self._lock:
-                        self._failed_browsers[browser_index] = time.time()
+                    self._mark_browser_failed(browser_index)
 
                     self.logger.warning(
                         f"Browser {browser_index} failed (attempt {attempt + 1}/3): "
@@ -968,59 +1089,83 @@ class PlaywrightMiddleware:
 
     def _select_browser_instance(self) -> Optional[int]:
         """选择可用的浏览器实例"""
-        pool_size = self.browser_pool.max_browsers if self.browser_pool else 1
+        pool_size = len(self._failed_at)
+        # 本次选择中最多获取一次代理，两处注册复用同一结果
+        proxy_addr = None
+        proxy_loaded = False
 
         # 首先尝试使用实例管理器推荐的实例
         if self.instance_manager:
             selected = self.instance_manager.get_available_instance_id()
             if selected is not None and selected not in self.ban_detector.browser_instances:
-                proxy_addr = None
-                if self.proxy_manager:
-                    try:
-                        proxy_dict = self.proxy_manager.get_random_proxy(mark_used=False)
-                        proxy_addr = proxy_dict.get('proxy') if proxy_dict else None
-                    except:
-                        pass
+                proxy_addr = self._get_proxy_once()
+                proxy_loaded = True
                 self.instance_manager.register_instance(selected, proxy_addr)
 
                 if not self.ban_detector.is_instance_banned(selected):
-                    # 检查失败黑名单
-                    with self._lock:
-                        if selected not in self._failed_browsers or \
-                           time.time() - self._failed_browsers[selected] >= 300:
-                            return selected
-
-        # 轮询选择
-        for _ in range(pool_size):
-            idx = self._browser_index % pool_size
-            self._browser_index += 1
-
-            # 检查封禁状态
-            if self.ban_detector.is_instance_banned(idx):
-                continue
+                    # 检查失败冷却期：单个float的读取在GIL下是原子的，无需加锁
+                    if time.time() - self._failed_at[selected % pool_size] >= FAILED_BROWSER_COOLDOWN:
+                        return selected
+
+        # 轮询选择：从上次位置开始，在可用位图中取第一个置位的实例
+        # 读取位图快照无需加锁；与并发失败标记竞争时最多多选中一次刚失败的实例
+        full_mask = (1 << pool_size) - 1
+        mask = self._available_mask
+        if mask != full_mask:
+            # 有实例处于失败冷却期时才检查，冷却期一过即恢复，不依赖定时清理
+            mask = self._restore_expired()
+        while mask:
+            start = self._browser_index % pool_size
+            # 循环右移start位后取最低置位（lowest set bit）
+            rotated = ((mask >> start) | (mask << (pool_size - start))) & full_mask
+            idx = (start + (rotated & -rotated).bit_length() - 1) % pool_size
+            self._browser_index = idx + 1
+
+            # 检查封禁状态，被封禁的实例本轮跳过
+            if not self.ban_detector.is_instance_banned(idx):
+                break
+            mask &= ~(1 << idx)
+        else:
+            return None
 
-            # 检查失败黑名单
-            with self._lock:
-                if idx in self._failed_browsers:
-                    if time.time() - self._failed_browsers[idx] < 300:
-                        continue
-                    else:
-                        del self._failed_browsers[idx]
+        # 注册实例
+        if self.instance_manager and idx not in self.ban_detector.browser_instances:
+            if not proxy_loaded:
+                proxy_addr = self._get_proxy_once()
+            self.instance_manager.register_instance(idx, proxy_addr)
 
-            # 注册实例
-            if self.instance_manager and idx not in self.ban_detector.browser_instances:
-                proxy_addr = None
-                if self.proxy_manager:
-                    try:
-                        proxy_dict = self.proxy_manager.get_random_proxy(mark_used=False)
-                        proxy_addr = proxy_dict.get('proxy') if proxy_dict else None
-                    except:
-                        pass
-                self.instance_manager.register_instance(idx, proxy_addr)
+        return idx
 
-            return idx
+    def _get_proxy_once(self) -> Optional[str]:
+        """获取一个代理地址用于实例注册，未启用代理或获取失败时返回None"""
+        if not self.proxy_manager:
+            return None
+        try:
+            proxy_dict = self.proxy_manager.get_random_proxy(mark_used=False)
+            return proxy_dict.get('proxy') if proxy_dict else None
+        except Exception:
+            return None
 
-        return None
+    def _mark_browser_failed(self, browser_index: int):
+        """将实例移出可用位图，冷却期结束后在下一次选择实例时恢复"""
+        slot = browser_index % len(self._failed_at)
+        with self._lock:
+            self._failed_at[slot] = time.time()
+            self._available_mask &= ~(1 << slot)
+
+    def _restore_expired(self) -> int:
+        """恢复冷却期已过的槽位，返回恢复后的可用位图"""
+        now = time.time()
+        with self._lock:
+            expired = [slot for slot, failed_at in enumerate(self._failed_at)
+                       if not self._available_mask >> slot & 1
+                       and now - failed_at >= FAILED_BROWSER_COOLDOWN]
+            for slot in expired:
+                self._available_mask |= 1 << slot
+            mask = self._available_mask
+        if expired:
+            self.logger.debug("Restored %d browser instance(s) after cooldown", len(expired))
+        return mask
 
     def _replace_browser_instance(self, failed_instance_id: int) -> Optional[int]:
         """替换失败的浏览器实例"""
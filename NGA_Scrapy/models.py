@@ -34,7 +34,10 @@ class Topic(Base):
         Index('idx_topic_poster_id', 'poster_id'),
         Index('idx_topic_re_num', 're_num'),
         Index('idx_topic_partition', 'partition'),
-    )  
+        # 复合/覆盖索引：增量爬取按tid批量查询最后回复时间可走index-only scan
+        Index('idx_topic_tid_last_reply_re_num', 'tid', 'last_reply_date', 're_num', 'post_time'),
+        Index('idx_topic_partition_last_reply_date', 'partition', 'last_reply_date'),
+    )
 
 class Reply(Base):
     __tablename__ = 'reply'
@@ -44,6 +47,8 @@ class Reply(Base):
         Index('idx_reply_poster_id', 'poster_id'),
         Index('idx_reply_post_time', 'post_time'),
         Index('idx_reply_recommendvalue', 'recommendvalue'),
+        # 覆盖索引：按主题取最新回复时无需回表
+        Index('idx_reply_tid_post_time_rid', 'tid', 'post_time', 'rid'),
     )
 
     rid = Column(String(20), primary_key=True)
@@ -57,5 +62,6 @@ class Reply(Base):
     image_paths = Column(JSON)
     sampling_time = Column(String(50))
 
-    topic = relationship("Topic")
-    user = relationship("User")
+    # 仅保留外键列用于写入，关系属性不做延迟加载，避免意外访问时逐行发出额外的SELECT
+    topic = relationship("Topic", lazy='raise')
+    user = relationship("User", lazy='raise')
@@ -15,13 +15,13 @@
 #   - User(用户信息)
 #   - Topic(主题帖)
 #   - Reply(回复帖)
-# - 采用merge操作实现"存在则更新，不存在则插入"逻辑
+# - 采用批量 INSERT ... ON CONFLICT 实现"存在则更新，不存在则插入"逻辑（不支持的数据库回退到merge）
 
 # #### 数据处理流程
 # 1. 根据item类型路由到对应的处理方法
-# 2. 将item数据转换为ORM模型对象
-# 3. 执行数据库合并操作(merge)
-# 4. 提交事务或出错时回滚
+# 2. 将item数据转换为字典并按主键写入缓冲区
+# 3. 每batch_size个item批量upsert一次（用户 -> 主题 -> 回复）
+# 4. 提交事务，出错时回滚并逐行merge
 
 # #### 错误处理
 # - 捕获SQLAlchemyError数据库异常
@@ -32,6 +32,7 @@
 # #### 生命周期管理
 # - 爬虫启动时创建数据库会话(open_spider)
 # - 爬虫关闭时安全关闭会话(close_spider)
+# - 批量写库通过deferToThread在线程池中执行，不阻塞reactor；批次经DeferredLock按产生顺序串行写入
 # - 保证会话资源正确释放
 
 # ### 3. 数据模型处理细节
@@ -81,7 +82,8 @@
 #    - `_process_reply`: 处理回复数据
 
 # ### 5. 技术细节
-# - 使用SQLAlchemy的merge操作实现upsert功能
+# - 使用ON CONFLICT批量upsert，merge作为回退路径
+# - PostgreSQL(psycopg2)下大批量回复先COPY到临时表，再INSERT ... SELECT ON CONFLICT
 # - 采用显式事务管理(commit/rollback)
 # - 通过isinstance检查item类型
 # - 合理的默认值处理(如匿名用户、推荐值0)
@@ -101,15 +103,20 @@
 #   - UserItem/TopicItem/ReplyItem
 
 # ### 8. 待优化点
-# - 批量插入/更新支持
-# - 异步数据库操作
 # - 更细粒度的错误分类处理
 # - 数据库连接池配置
 # - 性能监控指标
 
+import io
+import json
 import os
+import time
 import scrapy
+from sqlalchemy import JSON
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import scoped_session, sessionmaker
+from twisted.internet import defer, threads
+from scrapy.utils.defer import maybe_deferred_to_future
 import hashlib
 from scrapy.utils.python import to_bytes
 from urllib.parse import urlparse
@@ -119,14 +126,72 @@ from scrapy.exceptions import DropItem
 from . import settings
 from .models import User, Topic, Reply
 from .utils.db_utils import create_db_session
+from .utils.cache_manager import LocalCache
 from .items import UserItem,TopicItem,ReplyItem
 from scrapy.pipelines.images import ImagesPipeline
+from sqlalchemy.dialects import postgresql, sqlite
+
+try:
+    import orjson  # 可选依赖：C实现的JSON编码，未安装时使用标准库json
+except ImportError:
+    orjson = None
+
+# 支持 INSERT ... ON CONFLICT 的方言
+_UPSERT_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+# 回复数不少于该值时，PostgreSQL走 COPY 到临时表 + INSERT ... SELECT ON CONFLICT 的写入路径
+COPY_MIN_ROWS = 200
+
+
+def _csv_field(value):
+    """COPY CSV字段：None写为未加引号的空值（NULL），其余值一律加引号，区分空字符串"""
+    if value is None:
+        return ''
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def _json_text(value):
+    """JSON列的文本形式（与db_utils中引擎的json_serializer一致，非ASCII字符不转义）"""
+    if orjson is not None:
+        return orjson.dumps(value).decode('utf-8')
+    return json.dumps(value, ensure_ascii=False)
 
 class NgaPipeline:
     def __init__(self):
         self.session = None
+        self._insert = None  # 当前方言的 INSERT 构造器，不支持 ON CONFLICT 时为 None
+        self._use_copy = False  # 是否可用COPY批量写入回复（PostgreSQL + psycopg2）
+        self._db_errors = (SQLAlchemyError,)  # COPY直接使用DBAPI游标，其异常不会被包装为SQLAlchemyError
+        self._img_prefix = ''  # 图片存储路径前缀，在open_spider中计算一次
         self.item_count = 0
-        self.batch_size = 100  # 每100个item提交一次
+        self.batch_size = 500  # 每500个item批量写入一次
+        # 批次按取出顺序（DeferredLock按FIFO唤醒）逐个进入线程池写库，保证主题/用户先于引用它们的回复落库
+        self._write_lock = defer.DeferredLock()
+        self._ts_cache = (0.0, '')  # (生成时间, 格式化字符串)，秒级精度内复用
+        # 最近写入过的用户/主题，避免同一次爬取中重复upsert相同数据；只在批次提交成功后登记
+        self._seen_users = LocalCache(max_size=50000, ttl=3600)
+        self._seen_topics = LocalCache(max_size=50000, ttl=3600)
+        self._reset_buffers()
+
+    def _reset_buffers(self):
+        """重置写缓冲区，按主键去重（同一批次内后到的数据覆盖先到的）"""
+        self._buffers = {
+            'user': {},          # 来自UserItem的用户信息，冲突时更新
+            'default_user': {},  # 主题/回复发帖人的占位用户，已存在时不覆盖
+            'topic': {},
+            'reply': {},
+        }
+        self._pending = 0
+
+    def _now_s(self):
+        """当前采样时间字符串（与爬虫sampling_time格式一致），1秒内复用同一个格式化结果"""
+        now = time.time()
+        if now - self._ts_cache[0] >= 1.0:
+            self._ts_cache = (now, time.strftime("%Y-%m-%d-%H-%M-%S", time.localtime(now)))
+        return self._ts_cache[1]
 
     def _clean_recommendvalue(self, value):
         """清理recommendvalue字段，确保为有效整数"""
@@ -144,109 +209,253 @@ class NgaPipeline:
             return 0
 
     def open_spider(self, spider):
-        self.session = create_db_session()
+        self._img_prefix = settings.IMAGES_STORE.rstrip(os.sep) + os.sep
+        session = create_db_session()
+        if session:
+            engine = session.get_bind()
+            session.close()
+            # 写库在reactor线程池中执行，scoped_session保证每个线程使用独立的会话
+            self.session = scoped_session(sessionmaker(bind=engine))
+            self._insert = _UPSERT_INSERTS.get(engine.dialect.name)
+            dbapi = engine.dialect.dbapi
+            self._use_copy = (engine.dialect.name == 'postgresql'
+                              and getattr(dbapi, '__name__', '') == 'psycopg2')
+            if self._use_copy:
+                self._db_errors = (SQLAlchemyError, dbapi.Error)
 
-    def close_spider(self, spider):
+    async def close_spider(self, spider):
         if self.session:
+            # 关闭前写入剩余的数据（排在所有进行中的批次之后）
             try:
-                # 关闭前提交剩余的数据
-                self.session.commit()
+                await self._flush(self._take_buffers(), spider)
                 spider.logger.info(f"Final commit: {self.item_count} items processed")
-                self.session.close()
             except Exception as e:
                 spider.logger.error(f"Error closing session: {e}")
 
-    def process_item(self, item, spider):
+    async def process_item(self, item, spider):
+        if isinstance(item, UserItem):
+            buffered = self._process_user(item)
+        elif isinstance(item, TopicItem):
+            buffered = self._process_topic(item)
+            if not buffered:
+                # 相同的主题记录本次爬取中已提交过，与刚提交的一样通知爬虫
+                self._notify_topics_committed(spider, {item['tid']: item})
+        elif isinstance(item, ReplyItem):
+            buffered = self._process_reply(item)
+        else:
+            return item
+
+        if not buffered:
+            return item
+
+        self.item_count += 1
+        self._pending += 1
+        # 批量写入，每batch_size个item刷新一次
+        # 写库放到线程池中执行，避免阻塞reactor；写入完成后再返回item
+        if self._pending >= self.batch_size:
+            await self._flush(self._take_buffers(), spider)
+        return item
+
+    async def _flush(self, buffers, spider):
+        """在reactor线程中调用：取出的批次排队串行写库，提交成功后登记已写入的用户/主题"""
+        committed = await maybe_deferred_to_future(
+            self._write_lock.run(threads.deferToThread, self._write_batch, buffers, spider))
+        self._mark_committed(committed, spider)
+
+    def _mark_committed(self, committed, spider):
+        """登记已提交的用户和主题，之后相同的数据不再重复写入；写入失败的数据不登记，再次出现时仍会进入缓冲区
+
+        已提交的主题行交给爬虫的topics_committed（如有），由爬虫更新依赖数据库记录的缓存
+        """
+        if not committed:
+            return
+        for uid in committed['user']:
+            self._seen_users.set(uid, True)
+        for tid, row in committed['topic'].items():
+            self._seen_topics.set(tid, (row['last_reply_date'], row['re_num']))
+        if committed['topic']:
+            self._notify_topics_committed(spider, committed['topic'])
+
+    def _notify_topics_committed(self, spider, rows):
+        """把已提交的主题行（tid -> 行）交给爬虫的topics_committed（如有）"""
+        topics_committed = getattr(spider, 'topics_committed', None)
+        if topics_committed is not None:
+            topics_committed(rows)
+
+    def _take_buffers(self):
+        """取出当前缓冲区并换上新的空缓冲区（在reactor线程中调用）"""
+        buffers = self._buffers if self._pending else None
+        self._reset_buffers()
+        return buffers
+
+    def _write_batch(self, buffers, spider):
+        """将一批数据upsert到数据库并提交（在线程池中调用），返回提交成功的数据（结构与buffers相同）"""
+        if not buffers:
+            return None
+
         try:
-            if isinstance(item, UserItem):
-                self._process_user(item)
-            elif isinstance(item, TopicItem):
-                self._process_topic(item)
-            elif isinstance(item, ReplyItem):
-                self._process_reply(item)
-
-            self.item_count += 1
-            # 批量提交，每batch_size个item提交一次
-            if self.item_count % self.batch_size == 0:
+            if self._insert is None:
+                # 不支持 ON CONFLICT 的数据库直接走逐行merge
+                return self._merge_buffers(buffers, spider)
+
+            try:
+                self._write_buffers(buffers)
                 self.session.commit()
                 spider.logger.debug(f"Batch commit: {self.item_count} items")
-        except SQLAlchemyError as e:
-            self.session.rollback()
-            spider.logger.error(f"Database error: {e}")
-        return item
+                return buffers
+            except self._db_errors as e:
+                self.session.rollback()
+                spider.logger.warning(f"Bulk upsert failed, falling back to per-row merge: {e}")
+                return self._merge_buffers(buffers, spider)
+        finally:
+            # 每个批次可能落在线程池的任一线程上，写完即释放该线程的会话和连接
+            self.session.remove()
+
+    def _write_buffers(self, buffers):
+        """按 用户 -> 主题 -> 回复 的顺序写入，保证外键依赖先落库"""
+        insert = self._insert
+        self._upsert(insert, User, list(buffers['user'].values()))
+        if buffers['default_user']:
+            stmt = insert(User).on_conflict_do_nothing(index_elements=['uid'])
+            self.session.execute(stmt, list(buffers['default_user'].values()))
+        self._upsert(insert, Topic, list(buffers['topic'].values()))
+        replies = list(buffers['reply'].values())
+        if self._use_copy and len(replies) >= COPY_MIN_ROWS:
+            self._copy_upsert(Reply, replies)
+        else:
+            self._upsert(insert, Reply, replies)
+
+    def _upsert(self, insert, model, rows):
+        """INSERT ... ON CONFLICT (pk) DO UPDATE，只更新本次提供的列"""
+        if not rows:
+            return
+        pk = model.__mapper__.primary_key[0].name
+        stmt = insert(model)
+        update_cols = {
+            col: getattr(stmt.excluded, col)
+            for col in rows[0] if col != pk
+        }
+        stmt = stmt.on_conflict_do_update(index_elements=[pk], set_=update_cols)
+        self.session.execute(stmt, rows)
+
+    def _copy_upsert(self, model, rows):
+        """PostgreSQL: COPY到临时表后 INSERT ... SELECT ON CONFLICT (pk) DO UPDATE，与当前会话同一事务"""
+        table = model.__table__
+        pk = model.__mapper__.primary_key[0].name
+        columns = list(rows[0])
+        json_cols = {col for col in columns if isinstance(table.c[col].type, JSON)}
+        staging = f'_{table.name}_staging'
+        col_list = ', '.join(f'"{col}"' for col in columns)
+        update_list = ', '.join(f'"{col}" = EXCLUDED."{col}"' for col in columns if col != pk)
+
+        buf = io.StringIO()
+        for row in rows:
+            buf.write(','.join(
+                _csv_field(_json_text(row[col]) if col in json_cols and row[col] is not None
+                           else row[col])
+                for col in columns
+            ))
+            buf.write('\n')
+        buf.seek(0)
+
+        cursor = self.session.connection().connection.cursor()
+        try:
+            # ON COMMIT DELETE ROWS：临时表在连接内复用，提交后自动清空
+            cursor.execute(
+                f'CREATE TEMP TABLE IF NOT EXISTS "{staging}" '
+                f'(LIKE "{table.name}" INCLUDING DEFAULTS) ON COMMIT DELETE ROWS'
+            )
+            cursor.copy_expert(f'COPY "{staging}" ({col_list}) FROM STDIN WITH CSV', buf)
+            cursor.execute(
+                f'INSERT INTO "{table.name}" ({col_list}) SELECT {col_list} FROM "{staging}" '
+                f'ON CONFLICT ("{pk}") DO UPDATE SET {update_list}'
+            )
+        finally:
+            cursor.close()
+
+    def _merge_buffers(self, buffers, spider):
+        """逐行merge回退路径，单行失败不影响其他行；返回提交成功的数据"""
+        committed = {key: {} for key in buffers}
+        for key, model in (('user', User), ('default_user', User),
+                           ('topic', Topic), ('reply', Reply)):
+            for pk, row in buffers[key].items():
+                try:
+                    if key != 'default_user' or self.session.get(User, row['uid']) is None:
+                        self.session.merge(model(**row))
+                        self.session.commit()
+                    committed[key][pk] = row
+                except SQLAlchemyError as e:
+                    self.session.rollback()
+                    spider.logger.error(f"Database error: {e}")
+        return committed
+
+    def _ensure_user(self, poster_id):
+        """确保poster_id对应的用户存在，如果不存在则创建默认用户记录"""
+        if not poster_id or self._seen_users.get(poster_id) is not None:
+            return
+        if poster_id not in self._buffers['default_user']:
+            self._buffers['default_user'][poster_id] = {
+                'uid': poster_id,
+                'name': '',
+                'user_group': '匿名用户',
+                'prestige': '',
+                'reg_date': '',
+                'history_re_num': '',
+            }
 
     def _process_user(self, item):
-        user = User(
-            uid=item['uid'],
-            user_group=item.get('user_group', '匿名用户'),
-            reg_date=item.get('reg_date'),
-            prestige=item.get('prestige'),
-            history_re_num=item.get('history_re_num')
-        )
-        self.session.merge(user)
+        """返回是否写入了缓冲区（本次爬取已写过的用户直接跳过）"""
+        if self._seen_users.get(item['uid']) is not None:
+            return False
+
+        self._buffers['user'][item['uid']] = {
+            'uid': item['uid'],
+            'user_group': item.get('user_group', '匿名用户'),
+            'reg_date': item.get('reg_date'),
+            'prestige': item.get('prestige'),
+            'history_re_num': item.get('history_re_num'),
+        }
+        return True
 
     def _process_topic(self, item):
-        # 确保poster_id对应的用户存在，如果不存在则创建默认用户记录
-        poster_id = item.get('poster_id')
-        if poster_id:
-            existing_user = self.session.query(User).filter_by(uid=poster_id).first()
-            if not existing_user:
-                # 创建默认用户记录
-                default_user = User(
-                    uid=poster_id,
-                    name='',
-                    user_group='匿名用户',
-                    prestige='',
-                    reg_date='',
-                    history_re_num=''
-                )
-                self.session.merge(default_user)
-
-        topic = Topic(
-            tid=item['tid'],
-            title=item['title'],
-            poster_id=item['poster_id'],
-            post_time=item['post_time'],
-            re_num=item['re_num'],
-            sampling_time=item['sampling_time'],
-            last_reply_date=item.get('last_reply_date'),
-            partition=item.get('partition')
-        )
-        self.session.merge(topic)
+        """返回是否写入了缓冲区（最后回复时间和回复数都未变化的主题直接跳过）"""
+        version = (item.get('last_reply_date'), item['re_num'])
+        if self._seen_topics.get(item['tid']) == version:
+            return False
+
+        self._ensure_user(item.get('poster_id'))
+
+        self._buffers['topic'][item['tid']] = {
+            'tid': item['tid'],
+            'title': item['title'],
+            'poster_id': item['poster_id'],
+            'post_time': item['post_time'],
+            're_num': item['re_num'],
+            'sampling_time': item.get('sampling_time') or self._now_s(),
+            'last_reply_date': item.get('last_reply_date'),
+            'partition': item.get('partition'),
+        }
+        return True
 
     def _process_reply(self, item):
-        # 确保poster_id对应的用户存在，如果不存在则创建默认用户记录
-        poster_id = item.get('poster_id')
-        if poster_id:
-            existing_user = self.session.query(User).filter_by(uid=poster_id).first()
-            if not existing_user:
-                # 创建默认用户记录
-                default_user = User(
-                    uid=poster_id,
-                    name='',
-                    user_group='匿名用户',
-                    prestige='',
-                    reg_date='',
-                    history_re_num=''
-                )
-                self.session.merge(default_user)
+        self._ensure_user(item.get('poster_id'))
 
         # 清理recommendvalue字段，确保为有效整数
         recommendvalue = self._clean_recommendvalue(item.get('recommendvalue', '0'))
 
-        reply = Reply(
-            rid=item['rid'],
-            tid=item['tid'],
-            parent_rid=item.get('parent_rid'),
-            content=item['content'],
-            recommendvalue=recommendvalue,
-            poster_id=item['poster_id'],
-            post_time=item['post_time'],
-            sampling_time=item['sampling_time'],
-            image_urls=item.get('image_urls', []),
-            image_paths=[
-                os.path.join(settings.IMAGES_STORE, path)
-                for path in item.get('images', [])
-            ] if 'images' in item else []
-        )
-        self.session.merge(reply)
+        self._buffers['reply'][item['rid']] = {
+            'rid': item['rid'],
+            'tid': item['tid'],
+            'parent_rid': item.get('parent_rid'),
+            'content': item['content'],
+            'recommendvalue': recommendvalue,
+            'poster_id': item['poster_id'],
+            'post_time': item['post_time'],
+            'sampling_time': item.get('sampling_time') or self._now_s(),
+            'image_urls': item.get('image_urls', []),
+            'image_paths': [
+                self._img_prefix + path
+                for path in item.get('images', ())
+            ],
+        }
+        return True
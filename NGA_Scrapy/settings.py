@@ -21,12 +21,17 @@ IMAGES_STORE = 'download_images'
 
 PLAYWRIGHT_POOL_SIZE = 2  # 减少浏览器池大小，使用单实例多页面模式提高效率
 DOWNLOAD_TIMEOUT = 30     # 增加超时时间，应对高负载
+SKIP_UNCHANGED_LIST_PAGES = True  # 主题列表页的主题/最后回复时间/回复数与上次抓取（指纹缓存在Redis，1小时内有效）相同时跳过该页；指纹在该页主题（及需要抓取的回复）全部写库提交后才记录，回复页下载失败或写库失败的列表页下次仍会处理
+REPLY_PAGE_FAN_OUT = True  # 得到总页数后一次性生成回复页请求并发下载：新主题为全部页，已有主题从数据库回复数推算的第一条新回复所在页（每页20楼）开始，推算偏晚时再从该页逐页向前翻；关闭时逐页向前翻到旧回复为止
 
 # 遵守 robots.txt 规则
 ROBOTSTXT_OBEY = False
 
 # 配置日志
 LOG_LEVEL = 'DEBUG'
+DEBUG_URL_LOG = False  # 是否在中间件中记录每个read.php请求及调度队列长度（排查队列拥塞时开启）
+DEBUG_QUEUE_LOG = False  # 是否每10秒记录一次爬虫调度队列长度（队列超过100时告警）
+DEBUG_HTML = False  # 是否将异常的主题列表页（非NGA内容/反爬提示/无主题）保存到debug_html目录
 
 # 日志配置
 LOG_FILE = 'nga_spider.log'
@@ -34,6 +39,11 @@ LOG_FILE_MAX_BYTES = 10 * 1024 * 1024  # 10MB
 LOG_FILE_BACKUP_COUNT = 5
 LOG_FORMAT = '%(asctime)s [%(name)s] %(levelname)s: %(message)s'
 LOG_DATEFORMAT = '%Y-%m-%d %H:%M:%S'
+# 日志写入走 QueueHandler + QueueListener：发日志的线程只入队，由单独线程按上面的大小/数量轮转写文件
+LOG_QUEUE_ENABLED = True
+EXTENSIONS = {
+    'NGA_Scrapy.extensions.QueueLogging': 0,
+}
 
 # 全局设置
 # 已在上面定义：LOG_LEVEL, LOG_FILE, LOG_FORMAT, LOG_DATEFORMAT, LOG_FILE_MAX_BYTES, LOG_FILE_BACKUP_COUNT
@@ -43,10 +53,14 @@ LOG_DATEFORMAT = '%Y-%m-%d %H:%M:%S'
 CONCURRENT_REQUESTS = 2  # 与浏览器池大小匹配
 CONCURRENT_REQUESTS_PER_DOMAIN = 2  # 每个域名的并发数
 DOWNLOAD_DELAY = 0.3  # 适度延迟，平衡速度和稳定性
+# reactor线程池同时承载Playwright页面获取、主题列表数据库查询和Pipeline批量写入，
+# 默认10个线程时长时间阻塞的页面获取可能占满线程池，数据库查询只能排队；
+# 20个线程仍小于数据库连接池容量（pool_size 15 + max_overflow 30）
+REACTOR_THREADPOOL_MAXSIZE = 20
 AUTOTHROTTLE_ENABLED = True  # 启用自动限速
 AUTOTHROTTLE_START_DELAY = 0.3  # 初始延迟
 AUTOTHROTTLE_MAX_DELAY = 30  # 最大延迟，给系统更多恢复时间
-AUTOTHROTTLE_TARGET_CONCURRENCY = 6.0  # 目标并发数，更保守的设置
+AUTOTHROTTLE_TARGET_CONCURRENCY = 2.0  # 目标并发数，与CONCURRENT_REQUESTS/浏览器池大小一致
 HTTPCACHE_ENABLED = False
 HTTPCACHE_EXPIRATION_SECS = 186400  # 缓存 1 天
 IMAGES_PIPELINE_MAX_SIZE = 1024*1024*5  # 限制最大图片尺寸(5MB)
@@ -56,7 +70,7 @@ USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTM
 RETRY_TIMES = 2  # 减少重试次数，避免过多重试加剧拥堵
 # 包含超时状态码和常见的反爬状态码
 # 403是IP被封，需要重试（可能是临时性的）
-RETRY_HTTP_CODES = [403, 408, 440, 444, 460, 463, 494, 495, 496, 499, 500, 502, 503, 504]
+RETRY_HTTP_CODES = frozenset({403, 408, 440, 444, 460, 463, 494, 495, 496, 499, 500, 502, 503, 504})
 RETRY_ENABLED = True
 
 # 新增：优化调度器配置，处理大量请求
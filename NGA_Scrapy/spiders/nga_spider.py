@@ -87,20 +87,328 @@
 # - 可添加更详细的统计信息
 
 import scrapy
-from scrapy import Request
+from scrapy import Request, signals
 from ..items import TopicItem, ReplyItem, UserItem
-from urllib.parse import parse_qs, urljoin
+from urllib.parse import urljoin
+from lxml import etree
+import logging
+import re
 import time
+import zlib
+from dataclasses import dataclass, field
+from collections import deque
 from datetime import datetime
-from sqlalchemy.orm import scoped_session
+from functools import lru_cache
+from itertools import count, islice
+from typing import Dict, List, Optional
+from sqlalchemy import bindparam, func, select, text
+from sqlalchemy.orm import scoped_session, sessionmaker
+from twisted.internet import task, threads
+from scrapy.utils.defer import maybe_deferred_to_future
 from sqlalchemy.exc import SQLAlchemyError
-from ..models import Base
+from ..models import Base, Topic, Reply, User
 from ..utils.monitoring import get_monitor, record_batch_query
-from ..utils.cache_manager import get_cache_manager
+from ..utils.cache_manager import LocalCache, get_cache_manager
 from ..utils.query_optimizer import QueryOptimizer
+from ..utils.db_utils import create_db_session
+from ..utils.data_archiver import DataArchiver
+from ..utils.debug_html import url_digest
 import psutil
 import os
 
+# 主题行字段的XPath在模块加载时编译一次，直接作用于主题行lxml元素，避免每次调用重新编译
+# 取属性/文本的XPath均使用smart_strings=False：直接返回普通str，不为每个结果创建带getparent()的包装字符串
+# 主题链接/作者/发布时间/回复数/分区所在元素一次遍历全部取出（按文档顺序），由_extract_topic_fields分派
+_XP_TOPIC_FIELDS = etree.XPath('.//a[contains(@class, "topic")] | .//*[@class="author"]'
+                               ' | .//span[contains(@class, "postdate")] | .//*[@class="replies"]'
+                               ' | .//td[@class="c2"]/span[@class="titleadd2"]/a[@class="silver"]')
+# 最后回复时间：replydate的title属性和文本合并为一次查询，按文档顺序属性在文本之前
+_XP_REPLYDATE = etree.XPath('.//a[contains(@class, "replydate")]/@title | .//a[contains(@class, "replydate")]/text()', smart_strings=False)
+_XP_TITLED_ATTRS = etree.XPath('.//*[@title and string-length(@title) > 8]/@title', smart_strings=False)
+_XP_ROW_TEXT = etree.XPath('string(.)', smart_strings=False)
+# 主题行在整个文档上查找，直接作用于response.selector.root，结果为lxml元素
+_XP_TOPIC_ROWS = etree.XPath('//*[contains(@class, "topicrow")]')
+# 回复页的XPath同样预编译：页面级的作用于response.selector.root，回复级的作用于每个回复框的lxml元素
+_XP_LAST_PAGE_HREF = etree.XPath('//a[contains(@class, "invert") and @title="最后页"]/@href', smart_strings=False)
+_XP_PAGE_HREFS = etree.XPath('//a[contains(@href, "page=")]/@href', smart_strings=False)
+_XP_REPLY_BOXES = etree.XPath('//*[@class="forumbox postbox"]')
+# 整页所有回复的发表时间，用于在逐条解析前判断整页是否都不新于数据库记录
+_XP_REPLY_POSTDATES = etree.XPath('//*[@class="forumbox postbox"]//*[starts-with(@id, "postdate")]/text()',
+                                  smart_strings=False)
+# 回复的ID/作者/内容/时间/推荐值所在元素一次遍历全部取出（按文档顺序），由_extract_reply_fields分派
+_XP_REPLY_FIELDS = etree.XPath('.//*[starts-with(@id, "postcontainer") or starts-with(@id, "postauthor") '
+                               'or starts-with(@id, "postcontent") or starts-with(@id, "postdate")]'
+                               ' | .//span[contains(@class, "recommendvalue")]')
+_XP_TEXT = etree.XPath('text()', smart_strings=False)
+_XP_QUOTE = etree.XPath('boolean(.//div[contains(@class, "quote")])')
+_XP_QUOTE_LINK = etree.XPath('.//a[contains(@title, "打开链接")]/@href', smart_strings=False)
+# 图片筛选（附件图片和表情）在XPath内完成，一次调用直接得到src列表
+_XP_IMG_SRCS = etree.XPath('.//img[contains(@src, "attachments") or contains(@src, "smile")]/@src', smart_strings=False)
+# 用户信息页
+_XP_USER_GROUP = etree.XPath('//label[contains(text(), "用 户 组")]/../span/span/text()', smart_strings=False)
+_XP_REG_DATE = etree.XPath('//label[contains(text(), "注册日期")]/../span/text()', smart_strings=False)
+_PAGE_NUM_RE = re.compile(r'page=(\d+)')
+_PAGE_PARAM_RE = re.compile(r'[?&]page=(\d+)')
+_PID_PARAM_RE = re.compile(r'[?&]pid=(\d+)')
+_TID_PARAM_RE = re.compile(r'tid=(\d+)')
+# 回复ID：pid<数字>Anchor（pid0Anchor为主楼）或纯数字
+_POST_ID_RE = re.compile(r'pid(\d+)Anchor|(\d+)')
+_AUTHOR_ID_RE = re.compile(r'用户ID (\d+)')
+_RELATIVE_REPLY_DATES = frozenset(('刚才', '今天', '昨天', '前天'))
+# 反爬提示关键词合并为一个预编译正则，一次扫描找出所有命中
+_ANTI_BOT_KEYWORDS = ('访问过于频繁', 'IP被封', '验证码', 'captcha', '人机验证', '您的访问异常')
+_ANTI_BOT_RE = re.compile('|'.join(map(re.escape, _ANTI_BOT_KEYWORDS)))
+
+
+def _first(values):
+    """取XPath结果的第一个值，没有结果时返回None"""
+    return values[0] if values else None
+
+
+def _extract_reply_fields(reply):
+    """从回复框元素中提取 (post_id, poster_href, poster_name, content, recommendvalue, post_time)
+
+    每个字段取文档顺序中第一个有值的元素，与逐字段XPath取第一个结果的语义一致；缺失的字段为None
+    """
+    post_id = poster_href = poster_name = content = recommendvalue = post_time = None
+    for el in _XP_REPLY_FIELDS(reply):
+        el_id = el.get('id') or ''
+        if el_id.startswith('postcontainer'):
+            if post_id is None:
+                anchor = el.find('a')
+                if anchor is not None:
+                    post_id = anchor.get('id')
+        elif el_id.startswith('postauthor'):
+            if poster_href is None:
+                poster_href = el.get('href')
+            if poster_name is None:
+                poster_name = _first(_XP_TEXT(el))
+        elif el_id.startswith('postcontent'):
+            # 只取postcontent后面全是数字的元素（排除postcontentandsubject等）
+            if content is None and not el_id[11:].strip('0123456789'):
+                content = _first(_XP_TEXT(el))
+        elif el_id.startswith('postdate'):
+            if post_time is None:
+                post_time = _first(_XP_TEXT(el))
+        if recommendvalue is None and el.tag == 'span' and 'recommendvalue' in (el.get('class') or ''):
+            recommendvalue = _first(_XP_TEXT(el))
+    return post_id, poster_href, poster_name, content, recommendvalue, post_time
+
+
+@lru_cache(maxsize=1024)
+def _extract_pid(url):
+    """从引用链接中提取被引用回复的pid，没有pid参数时返回None
+
+    同一主题中被反复引用的回复通常不多，缓存命中时不再重复匹配
+    """
+    match = _PID_PARAM_RE.search(url)
+    return match.group(1) if match else None
+
+
+def _extract_topic_fields(node):
+    """从主题行元素中提取 (topic_link, title, poster_id, poster_name, post_time, re_num, partition)
+
+    与_extract_reply_fields相同，每个字段取文档顺序中第一个有值的元素；缺失的字段为None
+    """
+    topic_link = title = poster_id = poster_name = post_time = re_num = partition = None
+    for el in _XP_TOPIC_FIELDS(node):
+        tag = el.tag
+        el_class = el.get('class') or ''
+        if tag == 'a' and 'topic' in el_class:
+            if topic_link is None:
+                topic_link = el.get('href')
+            if title is None:
+                title = _first(_XP_TEXT(el))
+        elif el_class == 'author':
+            if poster_id is None:
+                # 作者ID在title属性中（用户ID 12345），取第一个能匹配的
+                match = _AUTHOR_ID_RE.search(el.get('title') or '')
+                if match:
+                    poster_id = match.group(1)
+            if poster_name is None:
+                poster_name = _first(_XP_TEXT(el))
+        elif tag == 'span' and 'postdate' in el_class:
+            if post_time is None:
+                post_time = el.get('title')
+        elif el_class == 'replies':
+            if re_num is None:
+                re_num = _first(_XP_TEXT(el))
+        elif tag == 'a' and el_class == 'silver':
+            # 只有分区路径 td.c2/span.titleadd2/a.silver 会产出class恰为silver的元素
+            if partition is None:
+                partition = _first(_XP_TEXT(el))
+    return topic_link, title, poster_id, poster_name, post_time, re_num, partition
+
+
+def _chunked(iterable, size):
+    """按size个一组依次产出列表（Python 3.12的itertools.batched的等价实现）"""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+# 增量决策只需要这4列：Core SELECT返回元组，不构造ORM对象；expanding参数让语句形状固定，可命中SQLAlchemy编译缓存
+_TOPIC_LOOKUP_STMT = select(Topic.tid, Topic.last_reply_date, Topic.post_time, Topic.re_num).where(
+    Topic.tid.in_(bindparam('tids', expanding=True))
+)
+
+# 单个主题的最后回复时间：只取一列，不构造ORM对象
+_LAST_REPLY_STMT = select(Topic.last_reply_date).where(Topic.tid == bindparam('tid'))
+
+# 统计信息：三个COUNT合并为一条语句，一次往返
+_STATS_COUNT_STMT = select(
+    select(func.count()).select_from(Topic).scalar_subquery(),
+    select(func.count()).select_from(Reply).scalar_subquery(),
+    select(func.count()).select_from(User).scalar_subquery(),
+)
+# PostgreSQL上COUNT(*)是全表扫描，改读pg_class中由ANALYZE/autovacuum维护的估算行数
+_PG_STATS_COUNT_SQL = text(
+    "SELECT relname, reltuples::bigint FROM pg_class "
+    "WHERE relname IN ('topic', 'reply', 'user') AND relkind = 'r'"
+)
+
+# 主题列表页指纹缓存：键前缀和有效期（秒）
+PAGE_SIGNATURE_PREFIX = 'list_page_sig:'
+PAGE_SIGNATURE_TTL = 3600
+
+# 主题数据库信息缓存的键前缀，值与batch_query_topics_from_db返回的单个主题记录相同
+TOPIC_INFO_PREFIX = 'topic_info:'
+
+# 主题回复页数缓存：键前缀和有效期（秒），值为 [回复数, 最后一页页码]
+THREAD_LAST_PAGE_PREFIX = 'thread_last_page:'
+THREAD_LAST_PAGE_TTL = 7 * 24 * 3600
+
+# 调度队列诊断（DEBUG_QUEUE_LOG）的记录间隔（秒）和拥塞告警阈值
+QUEUE_LOG_INTERVAL = 10
+QUEUE_CONGESTION_THRESHOLD = 100
+
+# NGA回复页每页楼层数（主楼为0楼，第n楼在第 n // REPLIES_PER_PAGE + 1 页）
+REPLIES_PER_PAGE = 20
+
+# 请求URL模板（%格式化，不在每个请求上解析f-string）
+_LIST_URL_TPL = "https://bbs.nga.cn/thread.php?fid=-7&page=%d"
+_READ_URL_TPL = "https://bbs.nga.cn/read.php?tid=%s&page=999"
+_READ_PAGE_URL_TPL = "https://bbs.nga.cn/read.php?tid=%s&page=%d"
+
+# 单条查询最多携带的TID数量（PostgreSQL单语句绑定参数上限为32767）
+SINGLE_QUERY_MAX_TIDS = 30000
+# 查询性能记录攒够这么多条后再一次性交给监控器（整批只获取一次监控器的锁）
+QUERY_LOG_FLUSH_SIZE = 50
+
+# 单次查询结果的流式读取分块大小
+TOPIC_LOOKUP_YIELD_PER = 1000
+
+# NGA时间格式快速路径：一个正则覆盖 [年-]月-日 时:分[:秒]，年份可为4位或2位，
+# 与下面strptime格式列表中的'%Y-%m-%d'、'%y-%m-%d'、'%m-%d %H:%M'等价
+_NGA_TIME_RE = re.compile(r'(?:(\d{4}|\d{2})-)?(\d{1,2})-(\d{1,2})\s+(\d{1,2}):(\d{1,2})(?::(\d{1,2}))?')
+
+# 规范格式（定长、零填充），两个都是此格式时字符串字典序与时间先后一致
+_CANON_TIME_RE = re.compile(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}')
+
+# 以NGA时间开头的字符串：25-11-30 15:59, 2025-11-30 15:59:30 等（秒可有可无，前缀匹配只需到分钟）
+_NGA_TIME_PREFIX_RE = re.compile(r'\d{2,4}-\d{2}-\d{2}\s+\d{2}:\d{2}')
+# 从整行文本中提取时间的格式，按优先级排序
+_TEXT_TIME_RES = (
+    re.compile(r'(\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2})'),  # 2025-11-30 15:59:30
+    re.compile(r'(\d{2}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2})'),  # 25-11-30 15:59:30
+    re.compile(r'(\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2})'),        # 2025-11-30 15:59
+    re.compile(r'(\d{2}-\d{2}-\d{2}\s+\d{2}:\d{2})'),        # 25-11-30 15:59
+)
+
+# 快速路径未命中时依次尝试的格式（按优先级排序）
+_NGA_TIME_FORMATS = (
+    '%Y-%m-%d %H:%M:%S',  # 标准格式 2025-04-19 17:00:00
+    '%y-%m-%d %H:%M:%S',  # 简写年份 25-04-19 17:00:00
+    '%d-%m-%y %H:%M:%S',  # 日-月-年 19-04-25 17:00:00
+    '%Y-%m-%d %H:%M',     # 缺少秒
+    '%y-%m-%d %H:%M',     # 简写年份缺少秒
+    '%d-%m-%y %H:%M',     # 日-月-年缺少秒
+    '%m-%d %H:%M',        # 缺少年和秒
+    '%H:%M:%S',           # 只有时间
+    '%H:%M'               # 只有小时和分钟
+)
+
+
+@lru_cache(maxsize=4096)
+def _parse_nga_time_str(time_str):
+    """解析NGA时间字符串，无法解析时返回None
+
+    结果按字符串缓存：数据库中的最后回复时间和同一页的回复时间大量重复
+    """
+    # 定长的规范格式（2025-04-19 17:00:00 / 2025-04-19 17:00）按固定位置切片直接构造，不经过正则
+    length = len(time_str)
+    if (length == 19 or length == 16) and time_str[4] == '-' and time_str[7] == '-' \
+            and time_str[10] == ' ' and time_str[13] == ':' and (length == 16 or time_str[16] == ':'):
+        try:
+            return datetime(int(time_str[0:4]), int(time_str[5:7]), int(time_str[8:10]),
+                            int(time_str[11:13]), int(time_str[14:16]),
+                            int(time_str[17:19]) if length == 19 else 0)
+        except ValueError:
+            pass  # 非数字或数值越界，交给下面的通用解析
+
+    match = _NGA_TIME_RE.fullmatch(time_str)
+    if match:
+        year, month, day, hour, minute, second = match.groups()
+        if year is None:
+            # 没有年份时strptime('%m-%d %H:%M')取1900年，且不接受秒
+            year = 1900 if second is None else None
+        elif len(year) == 2:
+            # 与strptime的%y一致：00-68为20xx，69-99为19xx
+            year = int(year)
+            year += 2000 if year < 69 else 1900
+        if year is not None:
+            try:
+                return datetime(int(year), int(month), int(day), int(hour), int(minute), int(second or 0))
+            except ValueError:
+                pass  # 数值越界（如13月），交给下面的格式逐个尝试
+
+    for fmt in _NGA_TIME_FORMATS:
+        try:
+            return datetime.strptime(time_str, fmt)
+        except ValueError:
+            continue
+    return None
+
+@dataclass
+class TopicBatch:
+    """一页主题列表的列式存储：每个字段一个列表，同一下标对应同一个主题"""
+    page: object
+    tids: List[str] = field(default_factory=list)
+    titles: List[Optional[str]] = field(default_factory=list)
+    poster_ids: List[Optional[str]] = field(default_factory=list)
+    poster_names: List[Optional[str]] = field(default_factory=list)
+    post_times: List[str] = field(default_factory=list)
+    re_nums: List[Optional[str]] = field(default_factory=list)
+    last_reply_dates: List[str] = field(default_factory=list)
+    partitions: List[str] = field(default_factory=list)
+    row_indexes: List[int] = field(default_factory=list)
+    _positions: Dict[str, int] = field(default_factory=dict, repr=False)
+
+    def __len__(self):
+        return len(self.tids)
+
+    def signature(self):
+        """本页主题 (tid, 最后回复时间, 回复数) 的CRC32指纹，用于判断列表页与上次抓取相比是否有变化"""
+        parts = []
+        for tid, last_reply_date, re_num in zip(self.tids, self.last_reply_dates, self.re_nums):
+            parts.append(f"{tid}\x1f{last_reply_date}\x1f{re_num}")
+        return zlib.crc32('\x1e'.join(parts).encode('utf-8'))
+
+    def add(self, tid, title, poster_id, poster_name, post_time, re_num, last_reply_date, partition, row_index):
+        """追加一个主题；同一页重复出现的tid保留首次出现的位置，字段以最后一次为准"""
+        values = (title, poster_id, poster_name, post_time, re_num, last_reply_date, partition, row_index)
+        columns = (self.titles, self.poster_ids, self.poster_names, self.post_times,
+                   self.re_nums, self.last_reply_dates, self.partitions, self.row_indexes)
+        pos = self._positions.get(tid)
+        if pos is None:
+            self._positions[tid] = len(self.tids)
+            self.tids.append(tid)
+            for column, value in zip(columns, values):
+                column.append(value)
+        else:
+            for column, value in zip(columns, values):
+                column[pos] = value
+
+
 class NgaSpider(scrapy.Spider):
     name = 'nga'
     allowed_domains = ['bbs.nga.cn']
@@ -111,8 +419,6 @@ class NgaSpider(scrapy.Spider):
         # 不再在启动时清空日志文件，让Scrapy的日志轮转机制处理
         # 调度器需要读取日志文件获取统计信息，清空会导致数据丢失
 
-        # 缓存主题的最新回复时间，减少数据库查询
-        self.topic_last_reply_cache = {}
         # 初始化缓存管理器
         self.cache_manager = get_cache_manager()
         # 初始化查询优化器
@@ -123,25 +429,64 @@ class NgaSpider(scrapy.Spider):
         self.db_session = None
         self.db_url = kwargs.get('db_url')  # 允许从命令行传入db_url
         self.process = psutil.Process(os.getpid())  # 初始化监控
+        self.process.cpu_percent(None)  # 建立CPU采样基准，之后的调用返回距上次调用的CPU占用，无需阻塞等待
+        # 待提交给查询监控器的性能记录；deque的append/popleft是原子操作，线程池中的查询线程无需加锁
+        self._query_log = deque(maxlen=10000)
+        # 本次爬取中已生成过UserItem的用户（与pipeline的去重相同，LocalCache限制条目数），同一用户只交给pipeline一次
+        self._seen_users = LocalCache(max_size=50000, ttl=3600)
+        # 调度队列诊断的定时任务（DEBUG_QUEUE_LOG开启时在spider_opened中创建）
+        self._queue_log_task = None
+        # 进行中的主题回复抓取：抓取编号 -> [未完成的回复页请求数, 所属的待记录列表页, 回复全部抓取后生成的TopicItem]
+        self._thread_walks = {}
+        self._walk_ids = count()
+        # 等待记录指纹的列表页：指纹键 -> [指纹键, 指纹, 尚未写库提交的主题数]
+        self._pending_list_pages = {}
+        # 列表页等待写库的主题：tid -> [((最后回复时间, 回复数), 待记录列表页), ...]
+        self._topic_waits = {}
+        # 最后回复时间只能从整行文本中提取的次数（方式1-3都失败），关闭时输出，用于判断页面结构是否变化
+        self._row_text_fallbacks = 0
     
     @classmethod
     def from_crawler(cls, crawler, *args, **kwargs):
         spider = super(NgaSpider, cls).from_crawler(crawler, *args, **kwargs)
         # 初始化数据库连接
         spider._init_db()
+        # 调度队列诊断：按固定间隔记录一次队列长度，而不是在每个回调/每批请求中查询并记录
+        if crawler.settings.getbool('DEBUG_QUEUE_LOG', False):
+            crawler.signals.connect(spider._start_queue_log, signal=signals.spider_opened)
+            crawler.signals.connect(spider._stop_queue_log, signal=signals.spider_closed)
         return spider
+
+    def _start_queue_log(self, spider):
+        self._queue_log_task = task.LoopingCall(self._log_queue_size)
+        self._queue_log_task.start(QUEUE_LOG_INTERVAL, now=False)
+
+    def _stop_queue_log(self, spider):
+        if self._queue_log_task is not None and self._queue_log_task.running:
+            self._queue_log_task.stop()
+
+    def _log_queue_size(self):
+        """记录调度器中等待的请求数，超过阈值时告警"""
+        try:
+            queue_size = len(self.crawler.engine.scheduler)
+        except (AttributeError, TypeError):
+            self.logger.debug("⚠️ 无法获取调度器队列状态")
+            return
+        self.logger.debug(f"📊 [队列监控] 当前调度队列长度: {queue_size}")
+        if queue_size > QUEUE_CONGESTION_THRESHOLD:
+            self.logger.warning(f"⚠️ [队列拥塞] 队列长度({queue_size})超过{QUEUE_CONGESTION_THRESHOLD}，可能导致处理延迟！")
     
     def _init_db(self):
         """初始化数据库连接"""
-        from ..utils.db_utils import create_db_session
-        from ..utils.data_archiver import DataArchiver
         try:
-            # 使用scoped_session包装，确保线程安全
-            session_factory = create_db_session(self.db_url)
-            if session_factory is None:
+            # 使用scoped_session包装，确保线程安全：主题查询在线程池中执行，每个线程使用独立的会话
+            session = create_db_session(self.db_url)
+            if session is None:
                 raise RuntimeError("无法创建数据库会话工厂")
 
-            self.db_session = scoped_session(lambda: session_factory)
+            engine = session.get_bind()
+            session.close()
+            self.db_session = scoped_session(sessionmaker(bind=engine))
 
             # 初始化查询优化器
             self.query_optimizer = QueryOptimizer(self.db_session, self.logger)
@@ -164,8 +509,14 @@ class NgaSpider(scrapy.Spider):
     
     def close(self, reason):
         """爬虫关闭时清理资源"""
+        # 提交剩余的查询性能记录
+        self._flush_query_log()
+
+        if self._row_text_fallbacks:
+            self.logger.info(f"🕒 共有 {self._row_text_fallbacks} 个主题的最后回复时间需从整行文本中提取")
+
         # 执行月度数据归档
-        if hasattr(self, 'data_archiver') and self.data_archiver:
+        if self.data_archiver is not None:
             try:
                 self.logger.info("开始执行月度数据归档...")
                 archive_results = self.data_archiver.auto_archive()
@@ -179,7 +530,7 @@ class NgaSpider(scrapy.Spider):
                 self.logger.error(f"数据归档失败: {e}")
 
         # 关闭数据库会话
-        if hasattr(self, 'db_session') and self.db_session:
+        if self.db_session is not None:
             try:
                 self.db_session.remove()
                 self.logger.info("数据库会话已关闭")
@@ -189,19 +540,30 @@ class NgaSpider(scrapy.Spider):
         #super().close(reason)
     
     def print_stats(self):
-        """打印进度和性能统计信息"""
-        cpu = self.process.cpu_percent(interval=1)
+        """打印进度和性能统计信息（只输出DEBUG日志，未开启DEBUG时不采样、不查库）
+
+        CPU占用为距上次采样以来的平均值，非阻塞，可在reactor线程中调用
+        """
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
+        cpu = self.process.cpu_percent(None)
         mem = self.process.memory_info().rss / 1024 / 1024
         self.logger.debug(f"📊 CPU: {cpu}% | Memory: {mem:.2f} MB")
 
         # 获取数据库统计
-        if self.db_session:
+        if self.db_session is not None:
             try:
-                from ..models import Topic, Reply, User
-                topic_count = self.db_session.query(Topic).count()
-                reply_count = self.db_session.query(Reply).count()
-                user_count = self.db_session.query(User).count()
-                self.logger.debug(f"📈 DB统计: 主题={topic_count}, 回复={reply_count}, 用户={user_count}")
+                if self.db_session.get_bind().dialect.name == 'postgresql':
+                    # 从未ANALYZE过的表reltuples为-1
+                    counts = {name: max(n, 0) for name, n in self.db_session.execute(_PG_STATS_COUNT_SQL)}
+                    topic_count = counts.get('topic', 0)
+                    reply_count = counts.get('reply', 0)
+                    user_count = counts.get('user', 0)
+                    approx = '≈'
+                else:
+                    topic_count, reply_count, user_count = self.db_session.execute(_STATS_COUNT_STMT).one()
+                    approx = ''
+                self.logger.debug(f"📈 DB统计{approx}: 主题={topic_count}, 回复={reply_count}, 用户={user_count}")
             except Exception as e:
                 self.logger.debug(f"⚠️ 获取数据库统计失败: {e}")
 
@@ -212,12 +574,12 @@ class NgaSpider(scrapy.Spider):
         for page in range(1, pageNum):  # 爬取前pageNum页
             self.logger.debug(f"📄 生成第 {page} 页主题列表页请求")
             yield Request(
-                url=f"https://bbs.nga.cn/thread.php?fid=-7&page={page}",
+                url=_LIST_URL_TPL % page,
                 callback=self.parse_topic_list,
                 meta={'page': page}
             )
 
-    def parse_topic_list(self, response):
+    async def parse_topic_list(self, response):
         """两阶段主题列表解析：阶段1-收集所有主题信息"""
         # 解析主题列表
         page = response.meta.get('page', 'unknown')
@@ -227,28 +589,30 @@ class NgaSpider(scrapy.Spider):
         content_length = len(response.text)
         self.logger.debug(f"🔍 [DEBUG] 页面内容长度: {content_length} 字符")
 
-        # 保存页面HTML用于调试
-        self._save_response_html(response, page, content_length)
+        # 查找主题行
+        rows = _XP_TOPIC_ROWS(response.selector.root)
+        self.logger.info(f"📊 第 {page} 页主题列表共找到 {len(rows)} 个主题")
 
-        # 检查页面是否包含NGA内容
-        if 'nga' not in response.text.lower() and 'bbs.nga.cn' not in response.url:
-            self.logger.error(f"❌ [DEBUG] 页面可能不是NGA内容，保存HTML文件用于调试")
-            self._save_response_html(response, page, content_length, reason="not_nga_content")
+        # 找到主题行说明页面正常，只有没找到时才做诊断检查；
+        # 反爬/非NGA页面的提示都在页面开头，只检查前16KB，不扫描整页
+        if not rows:
+            body_head = response.text[:16384]
 
-        # 检查是否有反爬虫提示
-        anti_bot_keywords = ['访问过于频繁', 'IP被封', '验证码', 'captcha', '人机验证', '您的访问异常']
-        if any(keyword in response.text for keyword in anti_bot_keywords):
-            self.logger.error(f"❌ [DEBUG] 检测到反爬虫提示: {[kw for kw in anti_bot_keywords if kw in response.text]}")
-            self._save_response_html(response, page, content_length, reason="anti_bot_detected")
+            # 检查页面是否包含NGA内容
+            if 'nga' not in body_head.lower() and 'bbs.nga.cn' not in response.url:
+                self.logger.error(f"❌ [DEBUG] 页面可能不是NGA内容，保存HTML文件用于调试")
+                self._save_response_html(response, page, content_length, reason="not_nga_content")
 
-        # 查找主题行
-        rows = response.xpath('//*[contains(@class, "topicrow")]')
-        self.logger.info(f"📊 第 {page} 页主题列表共找到 {len(rows)} 个主题")
+            # 检查是否有反爬虫提示
+            hits = set(_ANTI_BOT_RE.findall(body_head))
+            if hits:
+                self.logger.error(f"❌ [DEBUG] 检测到反爬虫提示: {sorted(hits)}")
+                self._save_response_html(response, page, content_length, reason="anti_bot_detected")
 
         # 阶段1: 收集所有主题信息
-        topics_data = self._collect_topics_from_page(rows, page)
+        topics = self._collect_topics_from_page(rows, page)
 
-        if not topics_data:
+        if not topics:
             self.logger.warning(f"⚠️ 第 {page} 页没有收集到有效主题")
             self.logger.warning(f"⚠️ [DEBUG] 详细分析:")
             self.logger.warning(f"  - 原始rows数量: {len(rows)}")
@@ -264,41 +628,63 @@ class NgaSpider(scrapy.Spider):
 
             return
 
+        # 本页主题及其最后回复时间、回复数与上次抓取完全相同时，没有需要更新的内容，
+        # 跳过数据库查询、增量决策和回复页请求
+        signature_key = None
+        if self.settings.getbool('SKIP_UNCHANGED_LIST_PAGES', True):
+            signature = topics.signature()
+            signature_key = f"{PAGE_SIGNATURE_PREFIX}{page}"
+            if self.cache_manager.get(signature_key) == signature:
+                self.logger.info(f"⏭️ 第 {page} 页与上次抓取相比没有变化，跳过 {len(topics)} 个主题")
+                return
+
         # 阶段2: 批量查询数据库信息
-        all_tids = list(topics_data.keys())
+        all_tids = topics.tids
         self.logger.debug(f"🗄️ [DB调试] 第{page}页: 准备查询{len(all_tids)}个主题的数据库记录")
-        db_info = self.batch_query_topics_from_db(all_tids)
+        # 查询放到reactor线程池中执行，等待期间reactor继续处理其他页面的下载和解析
+        db_info = await maybe_deferred_to_future(
+            threads.deferToThread(self._query_topics_in_thread, all_tids)
+        )
         self.logger.debug(f"🗄️ [DB调试] 第{page}页: 数据库返回{len(db_info)}条记录, 新主题数: {len(all_tids) - len(db_info)}")
 
         # 阶段3: 智能决策哪些主题需要爬取回复
-        topics_to_crawl, topics_to_skip = self._decide_topics_to_crawl(topics_data, db_info)
+        topics_to_crawl, topics_to_skip = self._decide_topics_to_crawl(topics, db_info)
         self.logger.debug(f"🗄️ [DB调试] 第{page}页决策结果: 需爬取{len(topics_to_crawl)}个, 跳过{len(topics_to_skip)}个")
 
+        # 指纹要等本页每个主题带本页最后回复时间和回复数的记录都写库提交后才写入（见topics_committed），
+        # 需要抓取回复的主题在回复全部抓取后才生成该记录；回复页下载失败、写库失败或中途出错的页面
+        # 不记录指纹，下次仍会重新处理
+        pending_page = None
+        if signature_key:
+            pending_page = [signature_key, signature, len(topics)]
+            self._pending_list_pages[signature_key] = pending_page
+            for tid, version in zip(topics.tids, zip(topics.last_reply_dates, topics.re_nums)):
+                self._topic_waits.setdefault(tid, []).append((version, pending_page))
+
         # 阶段4: 批量生成数据项和请求
-        for item in self._process_topics_batch(topics_to_crawl, topics_to_skip, db_info):
+        for item in self._process_topics_batch(topics, topics_to_crawl, topics_to_skip, pending_page):
             yield item
 
-        self.logger.debug(f"📄 第 {page} 页处理完成: 总计{len(topics_data)}个主题, "
+        self.logger.debug(f"📄 第 {page} 页处理完成: 总计{len(topics)}个主题, "
                         f"爬取{len(topics_to_crawl)}个, 跳过{len(topics_to_skip)}个")
 
     def _save_response_html(self, response, page, content_length, reason=""):
-        """保存响应HTML到调试文件"""
-        import os
-        import time
-        from urllib.parse import urlparse
+        """保存响应HTML到调试文件（需开启DEBUG_HTML）
+
+        直接写入response.body原始字节，不经过response.text解码再编码
+        """
+        if not self.settings.getbool('DEBUG_HTML', False):
+            return None
 
         debug_dir = 'debug_html'
-        if not os.path.exists(debug_dir):
-            os.makedirs(debug_dir)
+        os.makedirs(debug_dir, exist_ok=True)
 
         timestamp = time.strftime("%Y%m%d_%H%M%S", time.localtime())
-        url_hash = hash(response.url) % 10000
+        url_hash = url_digest(response.url)
         filename = f"{timestamp}_page{page}_{url_hash}_{reason}.html"
         filepath = os.path.join(debug_dir, filename)
 
-        try:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                debug_header = f"""
+        debug_header = f"""
 <!-- DEBUG INFO (NGA Spider) -->
 <!-- Page: {page} -->
 <!-- URL: {response.url} -->
@@ -307,9 +693,15 @@ class NgaSpider(scrapy.Spider):
 <!-- Reason: {reason} -->
 <!-- ======================= -->
 
-"""
-                f.write(debug_header)
-                f.write(response.text)
+""".encode('utf-8')
+
+        try:
+            fd = os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                os.write(fd, debug_header)
+                os.write(fd, response.body)
+            finally:
+                os.close(fd)
 
             self.logger.debug(f"💾 [DEBUG] HTML已保存: {filepath}")
             return filepath
@@ -363,230 +755,250 @@ class NgaSpider(scrapy.Spider):
             self.logger.error(f"  - 分析页面结构时出错: {e}")
 
     def _collect_topics_from_page(self, rows, page):
-        """阶段1: 从页面收集所有主题的基础信息"""
-        topics_data = {}
-        idx = 0
+        """阶段1: 从页面收集所有主题的基础信息，按列存入TopicBatch"""
+        topics = TopicBatch(page=page)
+        # 缺少时间时使用的当前时间，整页只格式化一次
+        now_str = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
 
-        for idx, row in enumerate(rows, 1):
+        for idx, node in enumerate(rows, 1):
             self.logger.debug(f"🔍 收集第 {page} 页第 {idx} 个主题信息")
 
-            # 提取基础信息
-            topic_link = row.xpath('.//a[contains(@class, "topic")]/@href').get()
-            if not topic_link or 'tid=' not in topic_link:
+            # 提取基础信息（一次遍历取出全部字段）
+            topic_link, title, poster_id, poster_name, post_time, re_num, partition = _extract_topic_fields(node)
+            tid_match = _TID_PARAM_RE.search(topic_link) if topic_link else None
+            if tid_match is None:
                 continue
 
-            tid = topic_link.split('tid=')[1].split('&')[0]
-            title = row.xpath('.//a[contains(@class, "topic")]/text()').get()
+            tid = tid_match.group(1)
             if title == '帖子发布或回复时间超过限制':
                 continue
 
-            poster_id = row.xpath('.//*[@class="author"]/@title').re_first(r'用户ID (\d+)')
-            poster_name = row.xpath('.//*[@class="author"]/text()').get()
-            post_time = row.xpath('.//span[contains(@class, "postdate")]/@title').get()
-            re_num = row.xpath('.//*[@class="replies"]/text()').get()
-
             # 如果主题发布时间为None，使用当前时间
             if not post_time:
-                post_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+                post_time = now_str
                 self.logger.debug(f"🕒 主题 {tid} 无法获取发布时间，使用当前时间: {post_time}")
 
             # 提取最后回复时间（多种方式）
-            last_reply_date = self._extract_last_reply_date(row)
+            last_reply_date = self._extract_last_reply_date(node, now_str)
 
             # 获取分区信息
-            partition = '水区'
-            partition_el = row.xpath('.//td[@class="c2"]/span[@class="titleadd2"]/a[@class="silver"]/text()')
-            if partition_el:
-                partition = partition_el.get()
+            partition = partition or '水区'
 
             # 存储主题信息
-            topics_data[tid] = {
-                'title': title,
-                'poster_id': poster_id,
-                'poster_name': poster_name,
-                'post_time': post_time,
-                're_num': re_num,
-                'last_reply_date': last_reply_date,
-                'partition': partition,
-                'row_index': idx,
-                'page': page
-            }
+            topics.add(tid, title, poster_id, poster_name, post_time, re_num, last_reply_date, partition, idx)
 
-        self.logger.debug(f"📋 第 {page} 页收集完成，共收集 {len(topics_data)} 个有效主题")
-        return topics_data
+        self.logger.debug(f"📋 第 {page} 页收集完成，共收集 {len(topics)} 个有效主题")
+        return topics
 
-    def _extract_last_reply_date(self, row):
-        """提取最后回复时间的多种方式"""
+    def _extract_last_reply_date(self, node, now_str):
+        """提取最后回复时间的多种方式（node为主题行的lxml元素，now_str为都取不到时使用的当前时间）"""
         last_reply_date = None
 
-        # 方式1: 从 .replydate 的 title 属性提取
-        last_reply_date = row.xpath('.//a[contains(@class, "replydate")]/@title').get()
-
-        # 方式2: 从 .replydate 的文本内容提取（相对时间）
-        if not last_reply_date:
-            alt_date = row.xpath('.//a[contains(@class, "replydate")]/text()').get()
-            if alt_date and alt_date not in ['刚才', '今天', '昨天', '前天']:
-                last_reply_date = alt_date
+        # 方式1+2: 一次查询取 .replydate 的 title 属性和文本内容，取第一个非空且不是相对时间的值
+        for candidate in _XP_REPLYDATE(node):
+            if candidate and candidate not in _RELATIVE_REPLY_DATES:
+                last_reply_date = str(candidate)
+                break
 
         # 方式3: 查找所有有title属性的元素，筛选出时间格式的
         if not last_reply_date:
-            time_candidates = row.xpath('.//*[@title and string-length(@title) > 8]/@title').getall()
-            for candidate in time_candidates:
+            for candidate in _XP_TITLED_ATTRS(node):
                 if self._is_nga_time_format(candidate):
-                    last_reply_date = candidate
+                    last_reply_date = str(candidate)
                     break
 
-        # 方式4: 使用正则从整行文本中提取时间
+        # 方式4: 使用正则从整行文本中提取时间（需要拼接整行文本，只在前三种方式都失败时执行）
         if not last_reply_date:
-            row_text = row.xpath('string(.)').get()
-            last_reply_date = self._extract_time_from_text(row_text)
+            self._row_text_fallbacks += 1
+            last_reply_date = self._extract_time_from_text(_XP_ROW_TEXT(node))
 
         # 如果网页时间为None，使用当前时间作为fallback
         if not last_reply_date:
-            last_reply_date = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+            last_reply_date = now_str
 
         return last_reply_date
 
-    def _decide_topics_to_crawl(self, topics_data, db_info):
-        """阶段3: 智能决策哪些主题需要爬取回复"""
+    def _decide_topics_to_crawl(self, topics, db_info):
+        """阶段3: 智能决策哪些主题需要爬取回复
+
+        返回两个 (下标, 数据库最后回复时间, 数据库回复数) 列表，下标指向topics中的列
+        """
         topics_to_crawl = []
         topics_to_skip = []
 
-        for tid, topic_info in topics_data.items():
-            web_last_reply = topic_info['last_reply_date']
-            db_topic_info = db_info.get(tid, {})
-            db_last_reply = db_topic_info.get('last_reply_date')
+        # 先按tid一次取出数据库记录，再按列逐行比较
+        db_rows = [db_info.get(tid) or {} for tid in topics.tids]
+        db_last_replies = [db_row.get('last_reply_date') for db_row in db_rows]
 
-            # 更新缓存
-            self.topic_last_reply_cache[tid] = db_last_reply
+        # 整页的网页/数据库时间一次性批量比较
+        newer_mask = self._newer_mask(topics.last_reply_dates, db_last_replies)
 
+        for i, (tid, web_last_reply, web_re_num, db_row, db_last_reply, newer) in enumerate(
+                zip(topics.tids, topics.last_reply_dates, topics.re_nums, db_rows, db_last_replies, newer_mask)):
             # 决策逻辑：是否需要爬取该主题的回复
-            should_crawl = self._should_crawl_topic_replies(tid, web_last_reply, db_last_reply, topic_info, db_topic_info)
+            should_crawl = self._should_crawl_topic_replies(tid, db_last_reply, newer,
+                                                            web_re_num, db_row.get('re_num'))
 
             if should_crawl:
-                topics_to_crawl.append((tid, topic_info, db_last_reply))
+                topics_to_crawl.append((i, db_last_reply, db_row.get('re_num')))
                 self.logger.debug(f"✅ 主题 {tid} 需要爬取回复 (网页:{web_last_reply}, 数据库:{db_last_reply})")
             else:
-                topics_to_skip.append((tid, topic_info, db_last_reply))
+                topics_to_skip.append((i, db_last_reply, db_row.get('re_num')))
                 self.logger.debug(f"⏭️  主题 {tid} 跳过回复爬取 (网页:{web_last_reply}, 数据库:{db_last_reply})")
 
         return topics_to_crawl, topics_to_skip
 
-    def _should_crawl_topic_replies(self, tid, web_last_reply, db_last_reply, topic_info, db_topic_info=None):
-        """判断是否需要爬取主题的回复"""
+    def _newer_mask(self, web_times, db_times):
+        """批量比较两列时间，返回每一行网页时间是否比数据库时间新（与is_newer的判断一致）
+
+        同一页中的时间字符串大量重复，每个不同的字符串只解析一次；任一侧为空的行为False
+        """
+        parsed = {}
+        for time_str in set(web_times).union(db_times):
+            if time_str:
+                try:
+                    parsed[time_str] = self._parse_nga_time(time_str)
+                except Exception as e:
+                    self.logger.error(f"时间解析错误: {e}, time: {time_str}")
+                    parsed[time_str] = None
+
+        mask = []
+        for web_time, db_time in zip(web_times, db_times):
+            if not web_time or not db_time:
+                mask.append(False)
+                continue
+            dt1, dt2 = parsed[web_time], parsed[db_time]
+            # 解析失败时默认处理为新回复
+            mask.append(dt1 is None or dt2 is None or dt1 >= dt2)
+        return mask
+
+    def _should_crawl_topic_replies(self, tid, db_last_reply, newer, web_re_num, db_re_num=None):
+        """判断是否需要爬取主题的回复（newer为网页最后回复时间是否比数据库新）"""
         # 如果数据库中没有记录，需要爬取
         if not db_last_reply:
             return True
 
         # 如果网页时间比数据库时间新，需要爬取
-        if web_last_reply and self.is_newer(web_last_reply, db_last_reply):
+        if newer:
             return True
 
         # 如果回复数量有变化，可能需要爬取（可选的启发式判断）
-        web_re_num = topic_info.get('re_num', '0') or '0'
-        db_re_num = str(db_topic_info.get('re_num', 0)) if db_topic_info and db_topic_info.get('re_num') else '0'
-        if web_re_num and db_re_num and web_re_num != db_re_num:
+        web_re_num = web_re_num or '0'
+        db_re_num = str(db_re_num) if db_re_num else '0'
+        if web_re_num != db_re_num:
             self.logger.debug(f"🔢 主题 {tid} 回复数变化: 网页{web_re_num} vs 数据库{db_re_num}")
             return True
 
         return False
 
-    def _process_topics_batch(self, topics_to_crawl, topics_to_skip, db_info):
+    def _topic_item(self, topics, i, sampling_time, progress=None):
+        """由TopicBatch第i列生成TopicItem
+
+        progress为(最后回复时间, 回复数)时用它代替本页的值，即只更新主题的其他信息，不推进抓取进度
+        """
+        last_reply_date, re_num = progress or (topics.last_reply_dates[i], topics.re_nums[i])
+        return TopicItem(
+            tid=topics.tids[i],
+            title=topics.titles[i],
+            poster_id=topics.poster_ids[i],
+            post_time=topics.post_times[i],
+            re_num=re_num,
+            sampling_time=sampling_time,
+            last_reply_date=last_reply_date,
+            partition=topics.partitions[i],
+        )
+
+    def _user_item(self, uid, name):
+        """生成只包含基本信息的UserItem（其余字段留空）"""
+        return UserItem(
+            uid=uid,
+            name=name or '',
+            user_group='',
+            reg_date='',
+            prestige='',
+            history_re_num='',
+        )
+
+    def _first_seen_user(self, uid):
+        """本次爬取中第一次遇到该用户时返回True（列表页和回复页只生成基本信息的UserItem，重复生成没有意义）"""
+        if self._seen_users.get(uid) is not None:
+            return False
+        self._seen_users.set(uid, True)
+        return True
+
+    def _process_topics_batch(self, topics, topics_to_crawl, topics_to_skip, pending_page=None):
         """阶段4: 批量处理所有主题，生成数据项和请求"""
         reply_requests_count = 0
         total_count = len(topics_to_crawl)
+        sampling_time = self._now_time()
+
+        # 回复数与上次爬取时相同的主题，页数通常不变：直接请求缓存的最后一页，回复页无需再解析分页链接
+        # （页码与请求的页一致；缓存可能已过时的情况在parse_replies中按分页链接核对）
+        cached_last_pages = self.cache_manager.get_many(
+            f"{THREAD_LAST_PAGE_PREFIX}{topics.tids[idx]}" for idx, _, _ in topics_to_crawl
+        )
 
         # 处理需要爬取的主题
-        # 关键修复：添加小延迟控制生成速度，避免队列拥塞
-        # 生成速度必须 <= 处理速度，否则会堆积
-        for i, (tid, topic_info, db_last_reply) in enumerate(topics_to_crawl):
-            # 每生成8个请求暂停0.5秒（与并发数匹配），让Scrapy有时间处理
-            if i > 0 and i % 8 == 0:
-                self.logger.info(f"⏱️ [节流] 已生成{i}/{total_count}个请求，暂停0.5秒让调度器处理...")
-                time.sleep(0.5)
-            # 生成TopicItem
-            topic_item = TopicItem(
-                tid=tid,
-                title=topic_info['title'],
-                poster_id=topic_info['poster_id'],
-                post_time=topic_info['post_time'],
-                re_num=topic_info['re_num'],
-                sampling_time=self._now_time(),
-                last_reply_date=topic_info['last_reply_date'],
-                partition=topic_info['partition']
-            )
-            yield topic_item
+        # 请求直接交给调度器排队，下载速度由CONCURRENT_REQUESTS和AutoThrottle控制，
+        # 不在回调中sleep（会阻塞reactor，期间所有下载和解析都会停顿）
+        for i, (idx, db_last_reply, db_re_num) in enumerate(topics_to_crawl):
+            tid = topics.tids[idx]
+            # 生成TopicItem：最后回复时间和回复数保持数据库中的值（新主题为空），
+            # 本页的新值在回复全部抓取后才生成（见_finish_reply_page），回复未抓完时下次仍会重新抓取；
+            # 新主题也因此先有主题记录，回复写库时外键已满足
+            yield self._topic_item(topics, idx, sampling_time, progress=(db_last_reply, db_re_num))
 
             # 生成UserItem
-            if topic_info['poster_id']:
-                user_item = UserItem(
-                    uid=topic_info['poster_id'],
-                    name=topic_info['poster_name'] or '',
-                    user_group='',
-                    reg_date='',
-                    prestige='',
-                    history_re_num=''
-                )
-                yield user_item
+            poster_id = topics.poster_ids[idx]
+            if poster_id and self._first_seen_user(poster_id):
+                yield self._user_item(poster_id, topics.poster_names[idx])
 
             # 生成回复页请求（并发由 Scrapy 的 CONCURRENT_REQUESTS 控制）
+            re_num = topics.re_nums[idx]
+            walk_id = next(self._walk_ids)
+            reply_meta = {'tid': tid, 'walk': walk_id, 'db_last_reply': db_last_reply, 'db_re_num': db_re_num,
+                          're_num': re_num}
+            url = _READ_URL_TPL % tid
+            cached_last_page = cached_last_pages.get(f"{THREAD_LAST_PAGE_PREFIX}{tid}")
+            if cached_last_page and re_num is not None and cached_last_page[0] == re_num:
+                reply_meta['last_page'] = reply_meta['current_page'] = cached_last_page[1]
+                reply_meta['cached_last_page'] = True
+                url = _READ_PAGE_URL_TPL % (tid, cached_last_page[1])
+
             reply_request = Request(
-                url=f"https://bbs.nga.cn/read.php?tid={tid}&page=999",
+                url=url,
                 callback=self.parse_replies,
-                meta={'tid': tid, 'db_last_reply': db_last_reply},
+                errback=self._reply_page_failed,
+                meta=reply_meta,
                 priority=100,
-                dont_filter=False
+                dont_filter=True
             )
+            # 每个列表页上的主题各自跟踪一次回复抓取：回复页请求不经过去重，同一主题在列表页间移动时
+            # 两页各抓一次，不会有抓取在等待一个被过滤掉、既不回调也不进errback的请求
+            self._thread_walks[walk_id] = [1, pending_page, self._topic_item(topics, idx, sampling_time)]
             self.logger.debug(f"🔄 正在yield请求 {tid}...")
             yield reply_request
             reply_requests_count += 1
             self.logger.debug(f"✅ 成功yield请求 {tid}，计数: {reply_requests_count}/{total_count}")
             self.logger.debug(f"🚀 主题 {tid}: 已生成回复页请求 (第{i+1}/{total_count}个)")
-            
-            # 【诊断日志】每生成10个请求检查一次队列状态
-            if (i + 1) % 10 == 0:
-                if hasattr(self.crawler.engine, 'scheduler') and hasattr(self.crawler.engine.scheduler, 'queue'):
-                    queue_size = len(self.crawler.engine.scheduler.queue)
-                    self.logger.debug(f"📊 [生成请求队列诊断] 已生成{i+1}个请求，当前调度队列长度: {queue_size}")
 
         self.logger.debug(f"🗄️ [DB调试] 批处理完成: 生成{reply_requests_count}个回复页请求, 跳过{len(topics_to_skip)}个主题")
 
-        # 队列状态监控 - 关键调试信息
-        if hasattr(self.crawler.engine, 'scheduler') and hasattr(self.crawler.engine.scheduler, 'queue'):
-            queue_size = len(self.crawler.engine.scheduler.queue)
-            self.logger.debug(f"📊 [队列监控] 当前调度队列长度: {queue_size}, 生成请求总数: {reply_requests_count}")
-            if queue_size > 100:
-                self.logger.warning(f"⚠️ [队列拥塞] 队列长度({queue_size})超过100，可能导致处理延迟！")
-        else:
-            self.logger.warning("⚠️ 无法获取调度器队列状态")
-
         # 处理跳过的主题（只生成TopicItem，不生成请求）
-        for tid, topic_info, db_last_reply in topics_to_skip:
+        for idx, _, _ in topics_to_skip:
             # 即使跳过回复爬取，也要更新主题信息（保持数据新鲜度）
-            topic_item = TopicItem(
-                tid=tid,
-                title=topic_info['title'],
-                poster_id=topic_info['poster_id'],
-                post_time=topic_info['post_time'],
-                re_num=topic_info['re_num'],
-                sampling_time=self._now_time(),
-                last_reply_date=topic_info['last_reply_date'],
-                partition=topic_info['partition']
-            )
-            yield topic_item
+            yield self._topic_item(topics, idx, sampling_time)
 
-            self.logger.debug(f"📝 主题 {tid}: 已更新主题信息（跳过回复爬取）")
+            self.logger.debug(f"📝 主题 {topics.tids[idx]}: 已更新主题信息（跳过回复爬取）")
 
     def get_last_reply_from_db(self, tid):
         """从数据库获取主题的最后回复时间"""
-        if not hasattr(self, 'db_session') or not self.db_session:
+        if self.db_session is None:
             self.logger.error("数据库会话未初始化")
             return None
 
         try:
-            from ..models import Topic  # 局部导入避免循环引用
-            topic = self.db_session.query(Topic).filter_by(tid=tid).first()
-            return topic.last_reply_date if topic else None
+            return self.db_session.execute(_LAST_REPLY_STMT, {'tid': tid}).scalar()
         except SQLAlchemyError as e:
             self.logger.error(f"查询数据库出错: {e}")
             return None
@@ -594,46 +1006,57 @@ class NgaSpider(scrapy.Spider):
             self.logger.error(f"获取最后回复时间时发生意外错误: {e}")
             return None
 
-    def batch_query_topics_from_db(self, tids, batch_size=100, use_cache=True, use_exists_optimization=True):
+    def _flush_query_log(self):
+        """将缓冲的查询性能记录一次性提交给监控器"""
+        records = []
+        try:
+            while True:
+                records.append(self._query_log.popleft())
+        except IndexError:
+            pass
+        if records:
+            get_monitor().record_query_bulk(records)
+
+    def _query_topics_in_thread(self, tids):
+        """在线程池中批量查询主题，结束后释放本线程的会话，连接归还连接池而不是停留在事务中"""
+        try:
+            return self.batch_query_topics_from_db(tids)
+        finally:
+            self.db_session.remove()
+
+    def batch_query_topics_from_db(self, tids, batch_size=100, use_cache=True, use_single_query=True):
         """批量查询数据库中多个主题的信息（终极优化版本）
 
         Args:
             tids: 主题ID列表
             batch_size: 每批查询的主题数量，默认100
             use_cache: 是否使用缓存，默认True
-            use_exists_optimization: 是否使用EXISTS优化，默认True
+            use_single_query: 未缓存TID超过1000个时是否合并为单次查询，默认True
 
         Returns:
             dict: {tid: {'last_reply_date': str, 'post_time': str, 're_num': int}}
         """
-        if not hasattr(self, 'db_session') or not self.db_session:
+        if self.db_session is None:
             self.logger.error("数据库会话未初始化")
             return {}
 
         if not tids:
             return {}
 
-        # 导入模块
-        from ..models import Topic
-        import time
-
         total_tids = len(tids)
         result = {}
         cached_count = 0
         db_query_count = 0
         query_strategy = 'in_query'  # 默认查询策略
 
-        # 缓存键前缀
-        cache_prefix = 'topic_info:'
-
         # 第一步：优先从缓存获取数据
         if use_cache:
-            for tid in tids:
-                cache_key = f"{cache_prefix}{tid}"
-                cached_data = self.cache_manager.get(cache_key)
-                if cached_data is not None:
-                    result[tid] = cached_data
-                    cached_count += 1
+            # 一次批量读取（本地缓存未命中的键用一次MGET查Redis），不逐个tid查询
+            cached = self.cache_manager.get_many(f"{TOPIC_INFO_PREFIX}{tid}" for tid in tids)
+            prefix_len = len(TOPIC_INFO_PREFIX)
+            for cache_key, cached_data in cached.items():
+                result[cache_key[prefix_len:]] = cached_data
+            cached_count = len(result)
 
             self.logger.debug(f"💾 [缓存] 从缓存获取 {cached_count}/{total_tids} 个主题数据")
 
@@ -646,48 +1069,39 @@ class NgaSpider(scrapy.Spider):
 
         if uncached_tids:
             # 根据数据量选择最优查询策略
-            if use_exists_optimization and len(uncached_tids) > 1000 and self.query_optimizer:
-                # 大量数据：使用EXISTS查询优化
-                query_strategy = 'exists_query'
-                existing_tids = self.query_optimizer.check_topics_exist_exists(uncached_tids)
-
-                # 只查询存在的主题
-                if existing_tids:
-                    existing_list = list(existing_tids)
-                    for i in range(0, len(existing_list), batch_size):
-                        batch_tids = existing_list[i:i + batch_size]
-                        batch_num = i // batch_size + 1
-
-                        query_start_time = time.time()
-                        try:
-                            topics = self.db_session.query(Topic).filter(Topic.tid.in_(batch_tids)).all()
-
-                            batch_result_count = 0
-                            for topic in topics:
-                                topic_data = {
-                                    'last_reply_date': topic.last_reply_date,
-                                    'post_time': topic.post_time,
-                                    're_num': topic.re_num
-                                }
-                                result[topic.tid] = topic_data
-                                batch_result_count += 1
-
-                                # 写入缓存
-                                if use_cache:
-                                    cache_key = f"{cache_prefix}{topic.tid}"
-                                    self.cache_manager.set(cache_key, topic_data)
-
-                            db_query_count += 1
-
-                            batch_elapsed = time.time() - query_start_time
-                            self.logger.debug(
-                                f"✅ [EXISTS优化] 批次 {batch_num}: 耗时{batch_elapsed:.3f}s, "
-                                f"返回{batch_result_count}条记录"
-                            )
+            if use_single_query and len(uncached_tids) > 1000:
+                # 大量数据：一次往返查询全部TID（超过单条语句参数上限时按上限分段）
+                query_strategy = 'single_query'
+                for chunk_tids in _chunked(uncached_tids, SINGLE_QUERY_MAX_TIDS):
 
-                        except Exception as e:
-                            self.logger.error(f"EXISTS优化批次 {batch_num} 查询出错: {e}")
-                            continue
+                    query_start_time = time.time()
+                    try:
+                        # 大结果集按yield_per分块流式读取（PostgreSQL使用服务端游标），不一次性缓冲全部行
+                        rows = self.db_session.execute(
+                            _TOPIC_LOOKUP_STMT, {'tids': chunk_tids},
+                            execution_options={'yield_per': TOPIC_LOOKUP_YIELD_PER}
+                        )
+                        row_count = 0
+                        for tid, last_reply_date, post_time, re_num in rows:
+                            topic_data = {
+                                'last_reply_date': last_reply_date,
+                                'post_time': post_time,
+                                're_num': re_num
+                            }
+                            result[tid] = topic_data
+                            row_count += 1
+
+                        db_query_count += 1
+
+                        chunk_elapsed = time.time() - query_start_time
+                        self.logger.debug(
+                            f"✅ [单次查询] 查询{len(chunk_tids)}个主题: 耗时{chunk_elapsed:.3f}s, "
+                            f"返回{row_count}条记录"
+                        )
+
+                    except SQLAlchemyError as e:
+                        self.logger.error(f"单次批量查询数据库出错: {e}")
+                        continue
 
             else:
                 # 中小数据：使用标准分批IN查询
@@ -696,9 +1110,7 @@ class NgaSpider(scrapy.Spider):
                 query_count = 0
                 start_time = time.time()
 
-                for i in range(0, len(uncached_tids), batch_size):
-                    batch_tids = uncached_tids[i:i + batch_size]
-                    batch_num = i // batch_size + 1
+                for batch_num, batch_tids in enumerate(_chunked(uncached_tids, batch_size), 1):
 
                     query_count += 1
                     query_start_time = time.time()
@@ -711,24 +1123,19 @@ class NgaSpider(scrapy.Spider):
                             self.logger.debug(f"🗄️ [DB调试] 查询{len(batch_tids)}个主题")
 
                         # 执行批次查询
-                        topics = self.db_session.query(Topic).filter(Topic.tid.in_(batch_tids)).all()
+                        rows = self.db_session.execute(_TOPIC_LOOKUP_STMT, {'tids': batch_tids}).all()
 
                         # 处理查询结果
                         batch_result_count = 0
-                        for topic in topics:
+                        for tid, last_reply_date, post_time, re_num in rows:
                             topic_data = {
-                                'last_reply_date': topic.last_reply_date,
-                                'post_time': topic.post_time,
-                                're_num': topic.re_num
+                                'last_reply_date': last_reply_date,
+                                'post_time': post_time,
+                                're_num': re_num
                             }
-                            result[topic.tid] = topic_data
+                            result[tid] = topic_data
                             batch_result_count += 1
 
-                            # 写入缓存
-                            if use_cache:
-                                cache_key = f"{cache_prefix}{topic.tid}"
-                                self.cache_manager.set(cache_key, topic_data)
-
                         db_query_count += 1
 
                         # 记录单批查询耗时
@@ -757,9 +1164,10 @@ class NgaSpider(scrapy.Spider):
                 # 记录总查询耗时
                 total_elapsed = time.time() - start_time
 
-                # 记录到监控系统
-                monitor = get_monitor()
-                monitor.record_query(total_elapsed, 'batch', batch_size, len(uncached_tids))
+                # 记录到监控系统（先缓冲，攒够一批再提交）
+                self._query_log.append((total_elapsed, 'batch', batch_size, len(uncached_tids), datetime.now()))
+                if len(self._query_log) >= QUERY_LOG_FLUSH_SIZE:
+                    self._flush_query_log()
 
                 # 查询性能统计
                 avg_query_time = total_elapsed / query_count if query_count > 0 else 0
@@ -785,6 +1193,13 @@ class NgaSpider(scrapy.Spider):
                         f"({len(uncached_tids)}个主题 / {total_elapsed:.3f}s)"
                     )
 
+            # 查询结果批量写回缓存（Redis一次往返）
+            if use_cache:
+                self.cache_manager.set_many({
+                    f"{TOPIC_INFO_PREFIX}{tid}": result[tid]
+                    for tid in uncached_tids if tid in result
+                })
+
         # 第三步：汇总统计信息
         cache_hit_rate = (cached_count / total_tids * 100) if total_tids > 0 else 0
 
@@ -809,11 +1224,6 @@ class NgaSpider(scrapy.Spider):
         # 立即记录方法被调用，用于调试
         self.logger.debug(f"🎯 parse_replies方法被调用! URL: {response.url}, Status: {response.status}")
 
-        # 【诊断日志】记录调度队列状态
-        if hasattr(self.crawler.engine, 'scheduler') and hasattr(self.crawler.engine.scheduler, 'queue'):
-            queue_size = len(self.crawler.engine.scheduler.queue)
-            self.logger.debug(f"📊 [parse_replies队列诊断] 当前调度队列长度: {queue_size}")
-
         tid = response.meta['tid']
         db_last_reply = response.meta.get('db_last_reply')
         current_page = response.meta.get('current_page', 'unknown')
@@ -821,31 +1231,73 @@ class NgaSpider(scrapy.Spider):
 
         self.logger.debug(f"💬 开始解析主题 {tid} 的回复 (当前页: {current_page}/{last_page}, URL: {response.url})")
 
-        meta={'tid': tid}
+        # 数据库最后回复时间和回复数随翻页请求传递，每一页都按数据库记录过滤已入库的回复
+        meta = {'tid': tid, 'walk': response.meta.get('walk'), 'db_last_reply': db_last_reply,
+                'db_re_num': response.meta.get('db_re_num')}
+        if 'fan_out' in response.meta:
+            # 已一次性生成过页面请求，之后只会逐页向前翻
+            meta['fan_out'] = False
 
         if 'last_page' not in response.meta:
-            last_page_link = response.xpath('//a[contains(@class, "invert") and @title="最后页"]/@href').get()
-            if last_page_link:
-                last_page = int(parse_qs(last_page_link.split('?')[1]).get('page', [1])[0])
-                #self.logger.info(f"最后一页{last_page}获取")
-            else:
-                page_links = [int(p.split('=')[-1]) for p in response.xpath('//a[contains(@href, "page=")]/@href').re(r'page=\d+')]
-                last_page = max(page_links) if page_links else 1
-
+            last_page = self._last_page_from_pager(response.selector.root)
             meta['last_page'] = last_page
             meta['current_page'] = last_page
 
+            re_num = response.meta.get('re_num')
+            if re_num is not None:
+                self.cache_manager.set(f"{THREAD_LAST_PAGE_PREFIX}{tid}", [re_num, last_page],
+                                       ttl=THREAD_LAST_PAGE_TTL)
+        else:
+            # 页数随翻页请求传递，同一主题只解析一次分页链接
+            meta['last_page'] = last_page
+
         if 'current_page' in response.meta:
             meta['current_page'] = response.meta['current_page']
 
         new_page_flag=True
-
-        replies = response.xpath('//*[@class="forumbox postbox"]')
+        # 本页生成的后续回复页请求数
+        new_requests = 0
+        # 整页解析完成后一次性返回全部数据项和请求：回调结束时页面文档树即可释放，
+        # 不会因为生成器挂起而在数据项逐个经过pipeline期间一直持有
+        results = []
+        # 同一页的回复使用同一个采样时间（以及缺少回复时间时使用的当前时间），整页只格式化一次
+        sampling_time = self._now_time()
+        now_str = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+
+        replies = _XP_REPLY_BOXES(response.selector.root)
         self.logger.debug(f"📜 主题 {tid}: 当前页 {current_page}/{last_page} 共有 {len(replies)} 条回复")
 
+        # 直接请求的缓存最后一页为空或已满时，缓存可能已过时（楼层增删后回复数恰好不变、每页楼层数变化等），
+        # 之后可能还有页面：按分页链接核对，不一致时改为请求真正的最后一页，本页的回复在向前翻页时再处理
+        if (response.meta.get('cached_last_page') and response.status == 200
+                and not 0 < len(replies) < REPLIES_PER_PAGE):
+            pager_last_page = self._last_page_from_pager(response.selector.root)
+            if pager_last_page != last_page:
+                self.logger.debug(f"🔁 主题 {tid}: 缓存的最后一页 {last_page} 与分页链接 {pager_last_page} 不一致，重新请求最后一页")
+                self._finish_reply_page(meta['walk'], 1)
+                return [Request(
+                    url=_READ_URL_TPL % tid,
+                    callback=self.parse_replies,
+                    errback=self._reply_page_failed,
+                    meta={'tid': tid, 'walk': meta['walk'], 'db_last_reply': db_last_reply,
+                          'db_re_num': meta['db_re_num'], 're_num': response.meta.get('re_num')},
+                    priority=100,
+                    dont_filter=True
+                )]
+
+        # 增量抓取时先看整页的发表时间：每条回复都有时间且全部不新于数据库记录时，
+        # 整页（以及更早的页）都不需要逐条解析；有回复缺少时间时走逐条解析（缺少时间的回复按当前时间处理）
+        if db_last_reply and replies:
+            post_times = _XP_REPLY_POSTDATES(response.selector.root)
+            if len(post_times) == len(replies) and not any(
+                    self.is_newer(post_time, db_last_reply) for post_time in post_times):
+                self.logger.debug(f"⏭️ 主题 {tid}: 第 {current_page} 页回复均不新于数据库记录 {db_last_reply}，跳过整页")
+                replies = []
+                new_page_flag = False
+
         for idx, reply in enumerate(replies, 1):
             self.logger.debug(f"📝 主题 {tid}: 开始处理第 {idx} 条回复 (当前页 {current_page}/{last_page})")
-            post_id = reply.xpath('.//*[starts-with(@id, "postcontainer")]/a[1]/@id').get()
+            post_id, poster_href, poster_name, content, recommendvalue, post_time = _extract_reply_fields(reply)
 
             # 安全检查：如果无法获取 post_id，跳过该回复
             if not post_id:
@@ -853,34 +1305,26 @@ class NgaSpider(scrapy.Spider):
                 continue
 
             # 统一使用纯数字格式
-            if post_id == 'pid0Anchor':
-                # 主楼使用 tid 作为 rid，纯数字格式
-                post_id = tid
-            elif 'pid' in post_id and 'Anchor' in post_id:
-                # 普通回复：从 Anchor 格式提取纯数字
-                # 例如：pid849526462Anchor → 849526462
-                post_id = post_id.replace('pid', '').replace('Anchor', '')
-            elif post_id.isdigit():
-                # 已经是纯数字格式，直接使用
-                pass
-            else:
+            post_id_match = _POST_ID_RE.fullmatch(post_id)
+            if post_id_match is None:
                 # 其他未知格式，记录警告并跳过
                 self.logger.warning(f"未知的 post_id 格式: {post_id} (tid={tid})")
                 continue
+            anchor_pid, plain_pid = post_id_match.groups()
+            if anchor_pid == '0':
+                # 主楼（pid0Anchor）使用 tid 作为 rid，纯数字格式
+                post_id = tid
+            else:
+                # 普通回复：从 Anchor 格式提取纯数字，例如 pid849526462Anchor → 849526462；
+                # 已经是纯数字格式的直接使用
+                post_id = anchor_pid or plain_pid
                 
-            poster_href = reply.xpath('.//*[starts-with(@id, "postauthor")]/@href').get()
             poster_id = poster_href.split('uid=')[1].split('&')[0] if poster_href and 'uid=' in poster_href else ''
-            poster_name = reply.xpath('.//*[starts-with(@id, "postauthor")]/text()').get()
-            
-            content = reply.xpath('.//*[starts-with(@id, "postcontent") '
-                                 'and string-length(translate(substring(@id, 12), "0123456789", "")) = 0]/text()').get()
-            
-            recommendvalue = reply.xpath('.//span[contains(@class,"recommendvalue")]/text()').get('0')
-            post_time = reply.xpath('.//*[starts-with(@id, "postdate")]/text()').get()
+            recommendvalue = recommendvalue or '0'
 
             # 如果回复时间为None，使用当前时间
             if not post_time:
-                post_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+                post_time = now_str
                 self.logger.debug(f"🕒 回复 {post_id} 无法获取时间，使用当前时间: {post_time}")
 
             # 如果设置了数据库最后回复时间，且当前回复时间不新于数据库记录，则跳过
@@ -890,18 +1334,13 @@ class NgaSpider(scrapy.Spider):
                 continue
             
             parent_rid = None
-            if reply.xpath('.//div[contains(@class, "quote")]'):
-                quote_link = reply.xpath('.//a[contains(@title, "打开链接")]/@href').get()
-                if quote_link and 'pid=' in quote_link:
-                    parent_rid = quote_link.split('pid=')[1].split('&')[0]
+            if _XP_QUOTE(reply):
+                quote_link = _first(_XP_QUOTE_LINK(reply))
+                if quote_link:
+                    parent_rid = _extract_pid(quote_link)
             
             # 新增图片URL提取逻辑
-            image_urls = []
-            # 提取所有img标签的src属性（包含data-srcorg备用）
-            for img in reply.xpath('.//img'):
-                src = img.xpath('@src').get()
-                if src and ('attachments' in src or 'smile' in src):
-                    image_urls.append(src)
+            image_urls = _XP_IMG_SRCS(reply)
 
             reply_item = ReplyItem(
                 rid=post_id,
@@ -911,43 +1350,161 @@ class NgaSpider(scrapy.Spider):
                 recommendvalue=recommendvalue,
                 post_time=post_time,
                 poster_id=poster_id,
-                sampling_time=self._now_time(),
-                image_urls=image_urls  # 添加图片URL列表
+                sampling_time=sampling_time,
+                image_urls=image_urls,  # 添加图片URL列表
             )
             self.logger.debug(f"✅ 主题 {tid}: 成功提取回复 {post_id} (时间: {post_time}, 用户: {poster_id}, 推荐值: {recommendvalue})")
-            yield reply_item
+            results.append(reply_item)
 
             # 创建用户信息（只包含基本信息，不发起额外请求）
-            if poster_id:
+            if poster_id and self._first_seen_user(poster_id):
                 self.logger.debug(f"👤 主题 {tid}: 为用户 {poster_id} 生成UserItem")
-                user_item = UserItem(
-                    uid=poster_id,
-                    name=poster_name or '',
-                    user_group='',
-                    reg_date='',
-                    prestige='',
-                    history_re_num=''
-                )
-                yield user_item
+                results.append(self._user_item(poster_id, poster_name))
 
         self.logger.debug(f"📄 主题 {tid}: 页面 {current_page}/{last_page} 解析完成，准备处理上一页")
-        # 处理上一页
-        if new_page_flag and meta['current_page'] > 1:
+        if response.meta.get('fan_out'):
+            # 由首页一次性生成的页面请求，不再继续翻页
+            self.logger.debug(f"✅ 主题 {tid}: 第 {current_page} 页处理完成")
+        elif (new_page_flag and meta['current_page'] > 1 and 'fan_out' not in response.meta
+              and self.settings.getbool('REPLY_PAGE_FAN_OUT', True)):
+            # 已知总页数后一次性生成可能包含新回复的各页请求，由调度器按CONCURRENT_REQUESTS并发下载，
+            # 不必逐页等待上一页解析完成：新主题为全部页，已有主题从数据库回复数推算的第一条新回复所在页开始
+            first_page = self._first_new_reply_page(db_last_reply, meta['db_re_num'], meta['current_page'])
+            self.logger.debug(f"🔀 主题 {tid}: 一次性生成第 {meta['current_page'] - 1}~{first_page} 页请求")
+            for page in range(meta['current_page'] - 1, first_page - 1, -1):
+                # 最早的一页fan_out=False：整页仍都是新回复时（推算偏晚，如有楼层被删除）从这里继续逐页向前翻
+                results.append(Request(
+                    url=_READ_PAGE_URL_TPL % (tid, page),
+                    callback=self.parse_replies,
+                    errback=self._reply_page_failed,
+                    meta={**meta, 'current_page': page, 'fan_out': page != first_page},
+                    dont_filter=True
+                ))
+                new_requests += 1
+        # 逐页向前翻，遇到不新于数据库记录的回复即停止
+        elif new_page_flag and meta['current_page'] > 1:
             meta['current_page'] = meta['current_page'] - 1
             self.logger.debug(f"⬅️ 主题 {tid}: 翻到上一页 {meta['current_page']} 页")
-            yield Request(
-                url=f"https://bbs.nga.cn/read.php?tid={tid}&page={meta['current_page']}",
+            results.append(Request(
+                url=_READ_PAGE_URL_TPL % (tid, meta['current_page']),
                 callback=self.parse_replies,
-                meta=meta
-            )
+                errback=self._reply_page_failed,
+                meta=meta,
+                dont_filter=True
+            ))
+            new_requests += 1
         else:
             self.logger.debug(f"✅ 主题 {tid}: 所有回复页处理完成")
 
+        if response.status == 200:
+            topic_item = self._finish_reply_page(meta['walk'], new_requests)
+            if topic_item is not None:
+                # 放在本页回复之后：pipeline按顺序串行写库，主题的抓取进度不会先于回复落库
+                results.append(topic_item)
+        else:
+            # 允许所有HTTP状态码进入回调（HTTPERROR_ALLOW_ALL），错误页面没有回复，按抓取失败处理
+            self._abandon_thread_walk(meta['walk'])
+
+        return results
+
+    def _last_page_from_pager(self, root):
+        """从回复页的分页链接中取出最后一页的页码，没有分页时为1"""
+        last_page_link = _first(_XP_LAST_PAGE_HREF(root))
+        if last_page_link:
+            page_match = _PAGE_PARAM_RE.search(last_page_link)
+            return int(page_match.group(1)) if page_match else 1
+        # 所有分页链接拼成一个字符串，一次findall取出全部页码
+        return max(map(int, _PAGE_NUM_RE.findall(' '.join(_XP_PAGE_HREFS(root)))), default=1)
+
+    def _finish_reply_page(self, walk_id, new_requests):
+        """一个回复页解析完成并生成了new_requests个后续页面请求
+
+        主题的回复页全部完成后返回带列表页上最后回复时间和回复数的TopicItem，否则返回None
+        """
+        walk = self._thread_walks.get(walk_id)
+        if walk is None:
+            return None
+        walk[0] += new_requests - 1
+        if walk[0] > 0:
+            return None
+        del self._thread_walks[walk_id]
+        return walk[2]
+
+    def topics_committed(self, rows):
+        """NgaPipeline在主题写库提交后调用（reactor线程），rows为 tid -> 已提交的主题行
+
+        主题信息缓存只写入已提交的值，与数据库记录一致：避免缓存中仍是旧的最后回复时间，
+        下次抓取时把已入库的回复当作新回复重新抓取；也不会在回复尚未入库时就把主题当作已是最新
+        """
+        self.cache_manager.set_many({
+            f"{TOPIC_INFO_PREFIX}{tid}": {
+                'last_reply_date': row['last_reply_date'],
+                'post_time': row['post_time'],
+                're_num': row['re_num'],
+            }
+            for tid, row in rows.items()
+        })
+
+        # 列表页上的主题以页面上的最后回复时间和回复数提交后计为完成（抓取回复的主题先提交的是保持
+        # 数据库原值的记录，不计入），页面上的主题全部完成后记录该页指纹
+        for tid, row in rows.items():
+            waits = self._topic_waits.pop(tid, None)
+            if not waits:
+                continue
+            version = (row['last_reply_date'], row['re_num'])
+            remaining = []
+            for wait in waits:
+                if wait[0] == version:
+                    self._list_page_topic_done(wait[1])
+                else:
+                    remaining.append(wait)
+            if remaining:
+                self._topic_waits[tid] = remaining
+
+    def _list_page_topic_done(self, pending_page):
+        """列表页的一个主题已写库提交；全部提交后写入该页指纹（已放弃记录的页面不再处理）"""
+        signature_key = pending_page[0]
+        if self._pending_list_pages.get(signature_key) is not pending_page:
+            return
+        pending_page[2] -= 1
+        if pending_page[2] <= 0:
+            del self._pending_list_pages[signature_key]
+            self.cache_manager.set(signature_key, pending_page[1], ttl=PAGE_SIGNATURE_TTL)
+
+    def _abandon_thread_walk(self, walk_id):
+        """主题的回复未能全部抓取：不再跟踪这次抓取，不推进主题的抓取进度，所属列表页也不记录指纹"""
+        walk = self._thread_walks.pop(walk_id, None)
+        if walk is None or walk[1] is None:
+            return
+        signature_key = walk[1][0]
+        if self._pending_list_pages.get(signature_key) is walk[1]:
+            del self._pending_list_pages[signature_key]
+
+    def _reply_page_failed(self, failure):
+        """回复页请求下载失败"""
+        request = failure.request
+        self.logger.warning(f"❌ 主题 {request.meta['tid']}: 回复页下载失败 ({request.url}): {failure.value!r}")
+        self._abandon_thread_walk(request.meta.get('walk'))
+
+    def _first_new_reply_page(self, db_last_reply, db_re_num, current_page):
+        """推算第一条新回复所在的页码（不超出 1 ~ current_page-1）
+
+        新主题需要全部页；已有主题的新回复从 db_re_num+1 楼开始；回复数未知时只取上一页，即逐页向前翻
+        """
+        if not db_last_reply:
+            return 1
+        try:
+            first_page = (int(db_re_num) + 1) // REPLIES_PER_PAGE + 1
+        except (TypeError, ValueError):
+            return current_page - 1
+        return min(max(first_page, 1), current_page - 1)
+
     # 其他方法保持不变...
     def parse_user(self, response):
         uid = response.meta['uid']
-        user_group = response.xpath('//label[contains(text(), "用 户 组")]/../span/span/text()').get('匿名用户')
-        reg_date = response.xpath('//label[contains(text(), "注册日期")]/../span/text()').get()
+        root = response.selector.root
+        user_group = _first(_XP_USER_GROUP(root)) or '匿名用户'
+        reg_date = _first(_XP_REG_DATE(root))
         
         user_item=UserItem(
             uid=uid,
@@ -960,6 +1517,10 @@ class NgaSpider(scrapy.Spider):
     def is_newer(self, time1, time2):
         """比较两个时间字符串，判断time1是否比time2新"""
         try:
+            # 数据库中的时间和大部分回复时间都是规范格式，直接比较字符串，无需解析
+            if _CANON_TIME_RE.fullmatch(time1) and _CANON_TIME_RE.fullmatch(time2):
+                return time1 >= time2
+
             # 处理NGA的时间格式可能不一致的情况
             dt1 = self._parse_nga_time(time1)
             dt2 = self._parse_nga_time(time2)
@@ -973,60 +1534,28 @@ class NgaSpider(scrapy.Spider):
         """解析NGA的各种时间格式"""
         if not time_str:
             return datetime.min
-        
-        # 尝试常见格式（按优先级排序）
-        formats = [
-            '%Y-%m-%d %H:%M:%S',  # 标准格式 2025-04-19 17:00:00
-            '%y-%m-%d %H:%M:%S',  # 简写年份 25-04-19 17:00:00
-            '%d-%m-%y %H:%M:%S',  # 日-月-年 19-04-25 17:00:00
-            '%Y-%m-%d %H:%M',     # 缺少秒
-            '%y-%m-%d %H:%M',     # 简写年份缺少秒
-            '%d-%m-%y %H:%M',     # 日-月-年缺少秒
-            '%m-%d %H:%M',        # 缺少年和秒
-            '%H:%M:%S',           # 只有时间
-            '%H:%M'               # 只有小时和分钟
-        ]
-        
-        for fmt in formats:
-            try:
-                return datetime.strptime(time_str, fmt)
-            except ValueError:
-                continue
-        
-        # 如果都不匹配，返回最小时间
-        self.logger.warning(f"无法解析的时间格式: {time_str}")
-        return datetime.min
+
+        parsed = _parse_nga_time_str(time_str)
+        if parsed is None:
+            # 如果都不匹配，返回最小时间
+            self.logger.warning(f"无法解析的时间格式: {time_str}")
+            return datetime.min
+        return parsed
 
 
     def _is_nga_time_format(self, time_str):
         """检查字符串是否为NGA时间格式"""
         if not time_str:
             return False
-        import re
-        # 匹配 NGA 时间格式: 25-11-30 15:59, 2025-11-30 15:59:30 等
-        patterns = [
-            r'\d{2,4}-\d{2}-\d{2}\s+\d{2}:\d{2}(?::\d{2})?',  # 标准格式
-            r'\d{2,4}-\d{2}-\d{2}\s+\d{2}:\d{2}',             # 简化格式
-        ]
-        for pattern in patterns:
-            if re.match(pattern, time_str.strip()):
-                return True
-        return False
+        return _NGA_TIME_PREFIX_RE.match(time_str.strip()) is not None
 
     def _extract_time_from_text(self, text):
         """从文本中使用正则表达式提取时间"""
         if not text:
             return None
-        import re
-        # 多种时间格式的正则表达式
-        patterns = [
-            r'(\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2})',  # 2025-11-30 15:59:30
-            r'(\d{2}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2})',  # 25-11-30 15:59:30
-            r'(\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2})',        # 2025-11-30 15:59
-            r'(\d{2}-\d{2}-\d{2}\s+\d{2}:\d{2})',        # 25-11-30 15:59
-        ]
-        for pattern in patterns:
-            match = re.search(pattern, text)
+        # 按格式优先级依次查找（不合并为一个正则：合并后会取文本中最靠前的时间，而不是优先级最高的格式）
+        for pattern in _TEXT_TIME_RES:
+            match = pattern.search(text)
             if match:
                 return match.group(1)
         return None
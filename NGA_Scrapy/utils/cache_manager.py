@@ -76,6 +76,39 @@ class LocalCache:
                     self.cache.popitem(last=False)
                 self.cache[key] = (time.time(), value)
 
+    def get_many(self, keys):
+        """批量获取缓存值，整批只加一次锁
+
+        Returns:
+            dict: 命中的 {key: value}
+        """
+        found = {}
+        now = time.time()
+        with self.lock:
+            for key in keys:
+                entry = self.cache.get(key)
+                if entry is not None:
+                    timestamp, value = entry
+                    if now - timestamp <= self.ttl:
+                        self.cache.move_to_end(key)
+                        found[key] = value
+                        continue
+                    del self.cache[key]
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, mapping):
+        """批量设置缓存值，整批只加一次锁"""
+        now = time.time()
+        with self.lock:
+            for key, value in mapping.items():
+                if key in self.cache:
+                    self.cache.move_to_end(key)
+                elif len(self.cache) >= self.max_size:
+                    self.cache.popitem(last=False)
+                self.cache[key] = (now, value)
+
     def delete(self, key):
         """删除缓存项"""
         with self.lock:
@@ -169,6 +202,41 @@ class RedisCache:
             logging.getLogger(__name__).error(f"Redis设置缓存失败: {e}")
             return False
 
+    def get_many(self, keys):
+        """批量获取缓存值（MGET，一次往返）
+
+        Returns:
+            dict: 命中的 {key: value}
+        """
+        if not self.enabled or not keys:
+            return {}
+
+        try:
+            values = self.redis_client.mget(keys)
+            return {
+                key: pickle.loads(value)
+                for key, value in zip(keys, values)
+                if value is not None
+            }
+        except Exception as e:
+            logging.getLogger(__name__).error(f"Redis批量获取缓存失败: {e}")
+            return {}
+
+    def set_many(self, mapping, ttl=3600):
+        """批量设置缓存值（非事务pipeline中逐个SETEX，一次往返且每个键都带过期时间）"""
+        if not self.enabled or not mapping:
+            return False
+
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for key, value in mapping.items():
+                pipe.setex(key, ttl, pickle.dumps(value))
+            pipe.execute()
+            return True
+        except Exception as e:
+            logging.getLogger(__name__).error(f"Redis批量设置缓存失败: {e}")
+            return False
+
     def delete(self, key):
         """删除缓存项"""
         if not self.enabled:
@@ -345,6 +413,48 @@ class CacheManager:
 
         return True
 
+    def get_many(self, keys):
+        """批量获取缓存值：先查本地缓存，未命中的键一次MGET查Redis并回写本地
+
+        Args:
+            keys: 缓存键列表
+
+        Returns:
+            dict: 命中的 {key: value}，未命中的键不在结果中
+        """
+        keys = list(keys)
+        self.stats['total_gets'] += len(keys)
+
+        found = self.local_cache.get_many(keys)
+        self.stats['local_hits'] += len(found)
+
+        if self.redis_cache.enabled and len(found) < len(keys):
+            missing = [key for key in keys if key not in found]
+            redis_found = self.redis_cache.get_many(missing)
+            self.stats['redis_hits'] += len(redis_found)
+            self.stats['redis_misses'] += len(missing) - len(redis_found)
+            if redis_found:
+                self.local_cache.set_many(redis_found)
+                found.update(redis_found)
+
+        # 与get()一致：local_misses记录两级缓存都未命中的次数
+        self.stats['local_misses'] += len(keys) - len(found)
+        return found
+
+    def set_many(self, mapping, ttl=None):
+        """批量设置缓存值（本地缓存 + Redis一次往返）"""
+        if not mapping:
+            return True
+        self.stats['total_sets'] += len(mapping)
+
+        self.local_cache.set_many(mapping)
+
+        if self.redis_cache.enabled:
+            ttl = ttl or self.config.get('local_cache', {}).get('ttl', 3600)
+            self.redis_cache.set_many(mapping, ttl)
+
+        return True
+
     def delete(self, key):
         """删除缓存项"""
         self.local_cache.delete(key)
@@ -1,10 +1,38 @@
 """数据库工具模块 - PostgreSQL版本"""
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import SQLAlchemyError
 from ..models import Base
 import logging
 
+try:
+    import orjson  # 可选依赖：更快的JSON编解码
+except ImportError:
+    orjson = None
+
+
+def _json_engine_args():
+    """JSON列（image_urls/image_paths）使用orjson序列化，未安装时使用SQLAlchemy默认的json"""
+    if orjson is None:
+        return {}
+    return {
+        'json_serializer': lambda value: orjson.dumps(value).decode('utf-8'),
+        'json_deserializer': orjson.loads,
+    }
+
+def _enable_sqlite_pragmas(engine):
+    """SQLite连接启用WAL日志和NORMAL同步级别，避免每次commit都fsync；其他数据库不做处理"""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
 def create_db_session(db_url=None):
     """
     创建PostgreSQL数据库会话
@@ -46,7 +74,7 @@ def create_db_session(db_url=None):
                 logger.error(f"❌ [数据库连接诊断] 基本连接测试失败: {test_e}")
                 raise test_e
             
-            engine = create_engine(db_url, **engine_args)
+            engine = create_engine(db_url, **engine_args, **_json_engine_args())
             
             # 测试连接池
             try:
@@ -57,7 +85,8 @@ def create_db_session(db_url=None):
                 raise pool_e
         else:
             logger.debug(f"🔍 [数据库连接诊断] 使用自定义URL: {db_url}")
-            engine = create_engine(db_url)
+            engine = create_engine(db_url, **_json_engine_args())
+            _enable_sqlite_pragmas(engine)
 
         Base.metadata.bind = engine
         Session = sessionmaker(bind=engine)
@@ -0,0 +1,13 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+调试HTML文件工具
+中间件和爬虫保存调试页面时共用的文件名规则
+"""
+
+import hashlib
+
+
+def url_digest(url: str) -> str:
+    """调试文件名中的URL标识：稳定的sha256摘要前10位（hash()按进程加盐，取模后容易碰撞）"""
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()[:10]
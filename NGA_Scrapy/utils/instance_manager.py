@@ -50,6 +50,10 @@ class BrowserInstanceManager:
         self._running = False
         self._monitor_thread = None
         self._replacement_thread = None
+        self._stop_event = threading.Event()  # stop()时唤醒正在等待的工作线程
+        self.stopped = threading.Event()  # 工作线程全部结束（或未启动）时置位
+        self.stopped.set()
+        self._live_workers = 0  # 尚未退出的工作线程数，由最后一个退出的线程置位stopped
 
         # 任务队列
         self._replacement_queue = Queue()
@@ -70,6 +74,9 @@ class BrowserInstanceManager:
             return
 
         self._running = True
+        self._stop_event.clear()
+        self.stopped.clear()
+        self._live_workers = 2  # 监控线程 + 替换线程
         self.logger.info("🚀 启动浏览器实例管理器")
 
         # 启动监控线程
@@ -101,6 +108,7 @@ class BrowserInstanceManager:
         self.logger.info(f"🛑 [诊断] 替换线程状态: {self._replacement_thread.is_alive() if self._replacement_thread else 'None'}")
 
         self._running = False
+        self._stop_event.set()
         self.logger.info("🛑 [诊断] 已设置_running = False，开始等待线程结束...")
 
         # 等待线程结束
@@ -120,7 +128,18 @@ class BrowserInstanceManager:
             else:
                 self.logger.info("✅ [诊断] 替换线程已结束")
 
-        self.logger.info("✅ [诊断] 浏览器实例管理器已停止")
+        # stopped由最后一个退出的工作线程置位；线程仍在运行时不置位，调用方可继续等待
+        if self.stopped.is_set():
+            self.logger.info("✅ [诊断] 浏览器实例管理器已停止")
+        else:
+            self.logger.warning("🛑 [诊断] 浏览器实例管理器已请求停止，但仍有工作线程未结束")
+
+    def _worker_exited(self):
+        """工作线程退出时调用，最后一个退出的线程置位stopped"""
+        with self._lock:
+            self._live_workers -= 1
+            if self._live_workers <= 0:
+                self.stopped.set()
 
     def register_instance(self, instance_id: int, proxy_address: Optional[str] = None):
         """注册新实例"""
@@ -181,11 +200,9 @@ class BrowserInstanceManager:
 
         while self._running:
             try:
-                # 每1分钟检查一次，更及时的监控
-                for _ in range(6):  # 1分钟 = 60秒，每次检查间隔10秒
-                    if not self._running:
-                        return
-                    time.sleep(10)
+                # 每1分钟检查一次，更及时的监控；stop()时立即唤醒退出
+                if self._stop_event.wait(60):
+                    break
 
                 # 检查所有实例状态
                 self._check_instances_health()
@@ -197,11 +214,12 @@ class BrowserInstanceManager:
 
             except Exception as e:
                 self.logger.error(f"监控线程出错: {e}")
-                if not self._running:
+                # 出错后等待30秒再继续
+                if self._stop_event.wait(30):
                     break
-                time.sleep(30)  # 出错后等待30秒再继续
 
         self.logger.info("👁️ 实例监控线程已退出")
+        self._worker_exited()
 
     def _check_instances_health(self):
         """检查实例健康状态"""
@@ -351,6 +369,7 @@ class BrowserInstanceManager:
                     break
 
         self.logger.info("🔧 实例替换线程已退出")
+        self._worker_exited()
 
     def _execute_replacement(self, task: ReplacementTask, force: bool = False):
         """执行实例替换"""
@@ -66,28 +66,42 @@ class QueryMonitor:
             topic_count: 查询的主题数量
         """
         with self.lock:
-            # 更新基础统计
-            self.query_stats['total_queries'] += 1
-            self.query_stats['total_time'] += query_time
-            self.query_stats['min_time'] = min(self.query_stats['min_time'], query_time)
-            self.query_stats['max_time'] = max(self.query_stats['max_time'], query_time)
-
-            # 保存查询耗时
-            self.query_stats['query_times'].append(query_time)
-
-            # 记录批次大小统计
-            if batch_size:
-                self.query_stats['batch_stats'][batch_size] += 1
-
-            # 记录每小时统计
-            now = datetime.now()
-            hour_key = now.strftime('%Y-%m-%d %H:00')
-            self.query_stats['hourly_stats'][hour_key]['count'] += 1
-            self.query_stats['hourly_stats'][hour_key]['total_time'] += query_time
-
-            # 慢查询检查
-            if query_time > self.slow_query_threshold:
-                self._record_slow_query(query_time, query_type, batch_size, topic_count)
+            self._record_locked(query_time, query_type, batch_size, topic_count, datetime.now())
+
+    def record_query_bulk(self, records):
+        """批量记录查询性能数据，整批只获取一次锁
+
+        Args:
+            records: (query_time, query_type, batch_size, topic_count, recorded_at) 元组序列，
+                recorded_at 为查询发生时的datetime，用于每小时统计
+        """
+        with self.lock:
+            for query_time, query_type, batch_size, topic_count, recorded_at in records:
+                self._record_locked(query_time, query_type, batch_size, topic_count, recorded_at)
+
+    def _record_locked(self, query_time, query_type, batch_size, topic_count, recorded_at):
+        """更新统计数据（调用方需持有self.lock）"""
+        # 更新基础统计
+        self.query_stats['total_queries'] += 1
+        self.query_stats['total_time'] += query_time
+        self.query_stats['min_time'] = min(self.query_stats['min_time'], query_time)
+        self.query_stats['max_time'] = max(self.query_stats['max_time'], query_time)
+
+        # 保存查询耗时
+        self.query_stats['query_times'].append(query_time)
+
+        # 记录批次大小统计
+        if batch_size:
+            self.query_stats['batch_stats'][batch_size] += 1
+
+        # 记录每小时统计
+        hour_key = recorded_at.strftime('%Y-%m-%d %H:00')
+        self.query_stats['hourly_stats'][hour_key]['count'] += 1
+        self.query_stats['hourly_stats'][hour_key]['total_time'] += query_time
+
+        # 慢查询检查
+        if query_time > self.slow_query_threshold:
+            self._record_slow_query(query_time, query_type, batch_size, topic_count)
 
     def _record_slow_query(self, query_time, query_type, batch_size, topic_count):
         """记录慢查询"""
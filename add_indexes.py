@@ -27,6 +27,22 @@ def check_index_exists(engine, index_name):
     return index_name in existing_indexes
 
 
+def create_index(engine, sql):
+    """执行建索引语句
+
+    PostgreSQL 改用 CREATE INDEX CONCURRENTLY，建索引期间不阻塞写入；它不能在事务中执行，需使用自动提交连接。
+    其他数据库（如SQLite）不支持该语法，按原语句执行
+    """
+    if engine.dialect.name == 'postgresql':
+        sql = sql.replace('CREATE INDEX ', 'CREATE INDEX CONCURRENTLY ', 1)
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.execute(text(sql))
+    else:
+        with engine.connect() as conn:
+            conn.execute(text(sql))
+            conn.commit()
+
+
 def add_indexes():
     """添加数据库索引"""
     try:
@@ -52,6 +68,8 @@ def add_indexes():
             ('idx_topic_poster_id', 'CREATE INDEX idx_topic_poster_id ON topic(poster_id);'),
             ('idx_topic_re_num', 'CREATE INDEX idx_topic_re_num ON topic(re_num);'),
             ('idx_topic_partition', 'CREATE INDEX idx_topic_partition ON topic(partition);'),
+            ('idx_topic_tid_last_reply_re_num', 'CREATE INDEX idx_topic_tid_last_reply_re_num ON topic(tid, last_reply_date, re_num, post_time);'),
+            ('idx_topic_partition_last_reply_date', 'CREATE INDEX idx_topic_partition_last_reply_date ON topic(partition, last_reply_date);'),
         ]
 
         reply_indexes = [
@@ -59,6 +77,7 @@ def add_indexes():
             ('idx_reply_poster_id', 'CREATE INDEX idx_reply_poster_id ON reply(poster_id);'),
             ('idx_reply_post_time', 'CREATE INDEX idx_reply_post_time ON reply(post_time);'),
             ('idx_reply_recommendvalue', 'CREATE INDEX idx_reply_recommendvalue ON reply(recommendvalue);'),
+            ('idx_reply_tid_post_time_rid', 'CREATE INDEX idx_reply_tid_post_time_rid ON reply(tid, post_time, rid);'),
         ]
 
         print("📊 Topic 表索引检查...")
@@ -74,9 +93,7 @@ def add_indexes():
                 print(f"  ⏳ 正在创建: {index_name}...")
                 start_time = time.time()
                 try:
-                    with engine.connect() as conn:
-                        conn.execute(text(sql))
-                        conn.commit()
+                    create_index(engine, sql)
                     elapsed = time.time() - start_time
                     print(f"  ✅ {index_name}: 创建成功 (耗时: {elapsed:.2f}s)")
                     created_count += 1
@@ -95,9 +112,7 @@ def add_indexes():
                 print(f"  ⏳ 正在创建: {index_name}...")
                 start_time = time.time()
                 try:
-                    with engine.connect() as conn:
-                        conn.execute(text(sql))
-                        conn.commit()
+                    create_index(engine, sql)
                     elapsed = time.time() - start_time
                     print(f"  ✅ {index_name}: 创建成功 (耗时: {elapsed:.2f}s)")
                     created_count += 1
@@ -126,12 +141,15 @@ def add_indexes():
         print("    - idx_topic_poster_id: 优化用户关联查询")
         print("    - idx_topic_re_num: 优化回复数排序")
         print("    - idx_topic_partition: 优化分区筛选")
+        print("    - idx_topic_tid_last_reply_re_num: 批量查询覆盖索引（index-only scan）")
+        print("    - idx_topic_partition_last_reply_date: 优化按分区+最后回复时间查询（复合索引）")
         print()
         print("  Reply表:")
         print("    - idx_reply_tid_post_time: 优化主题回复查询（复合索引）")
         print("    - idx_reply_poster_id: 优化用户回复查询")
         print("    - idx_reply_post_time: 优化时间范围查询")
         print("    - idx_reply_recommendvalue: 优化推荐值查询")
+        print("    - idx_reply_tid_post_time_rid: 主题最新回复查询覆盖索引")
         print()
 
         print("🎯 建议:")